@@ -0,0 +1,34 @@
+import harness  # noqa: F401
+from loguru import logger as log
+
+from constants import COMMAND_ALIASES
+from dispatch import CommandRegistry, fuzzycmdlookup
+
+log.remove()
+
+SAMPLES = {'exact': ['player', 'gear', 'raids', 'item', 'news', 'status'], 'typo': ['playr', 'gaer', 'riads', 'itme', 'nwes', 'staus'], 'unknown': ['zzzzzz', 'qwerty', 'asdfgh']}
+
+
+def command(name):
+    async def handler(message, user, guildconfig, *args):
+        pass
+    handler.__name__ = name
+    return handler
+
+
+def build_registry():
+    registry = CommandRegistry()
+    for name, aliases in COMMAND_ALIASES.items():
+        registry.register(command(name), aliases)
+    return registry
+
+
+def benchmarks():
+    registry = build_registry()
+
+    def cold():
+        fuzzycmdlookup.cache_clear()
+        for cmd in SAMPLES['typo']:
+            registry.resolve(cmd)
+
+    return {'resolve_exact': lambda: [registry.resolve(cmd) for cmd in SAMPLES['exact']], 'resolve_typo_memoized': lambda: [registry.resolve(cmd) for cmd in SAMPLES['typo']], 'resolve_typo_cold': cold, 'resolve_unknown_memoized': lambda: [registry.resolve(cmd) for cmd in SAMPLES['unknown']]}
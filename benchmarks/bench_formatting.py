@@ -0,0 +1,23 @@
+from harness import fixture
+
+from formatfunctions import convertprice, filter_details, truncate_float
+
+PRICES = [None, 'Not Available', 57, 4321, 158973, 12345678]
+FLOATS = [0.123456, 98.7654321, '12.3456', 42]
+
+
+def benchmarks():
+    item = fixture('item')
+
+    def prices():
+        for price in PRICES:
+            convertprice(price)
+
+    def floats():
+        for number in FLOATS:
+            truncate_float(number, 2)
+
+    def details():
+        filter_details(item['name'], item['tags'], item['tooltip'])
+
+    return {'convertprice': prices, 'truncate_float': floats, 'filter_details': details}
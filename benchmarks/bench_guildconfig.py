@@ -0,0 +1,25 @@
+from harness import FixtureRedis, fixture, run_sync
+
+import msgpack
+
+from guildconfigparser import GuildConfigParser, configcache
+
+GUILD_ID = '123456789012345678'
+
+
+def benchmarks():
+    redis = FixtureRedis({GUILD_ID: msgpack.packb(fixture('guildconfig'))})
+    complete = GuildConfigParser(redis, GUILD_ID)
+    complete.read_dict(fixture('guildconfig'))
+
+    def read_cold():
+        configcache.pop(GUILD_ID, None)
+        run_sync(GuildConfigParser(redis, GUILD_ID).read())
+
+    def read_cached():
+        run_sync(GuildConfigParser(redis, GUILD_ID).read())
+
+    def check_defaults():
+        run_sync(complete._check_defaults())
+
+    return {'read_cold': read_cold, 'read_cached': read_cached, 'check_defaults': check_defaults}
@@ -0,0 +1,17 @@
+import tempfile
+from pathlib import Path
+
+from harness import fixture
+
+from itemcatalog import ItemCatalog
+
+
+def benchmarks():
+    catalog = ItemCatalog(str(Path(tempfile.mkdtemp(prefix='wowinfobot-bench-')) / 'items.catalog'))
+    for entry in fixture('tables')['entries']:
+        for item in entry.get('gear', []):
+            if 'id' in item and 'name' in item:
+                catalog.add(item['id'], f"{item['name']} {item['id']}")
+    catalog.add(13937, 'Staff of Dominance')
+    catalog.save()
+    return {'lookup_exact': lambda: catalog.lookup('Staff of Dominance'), 'lookup_fuzzy': lambda: catalog.lookup('staf of dominanse'), 'lookup_miss': lambda: catalog.lookup('thunderfury blessed blade')}
@@ -0,0 +1,17 @@
+from harness import fixture
+
+import msgpack
+
+from cachemanager import _pack, _unpack
+import projections
+
+
+def benchmarks():
+    tables = fixture('tables')
+    fights = fixture('fights')
+    packed_tables = _pack(tables, 3600)
+    packed_fights = _pack(fights, 3600)
+    raw_tables = msgpack.packb(tables)
+    raw_fights = msgpack.packb(fights)
+    packed_projected_tables = _pack(projections.tables(tables), 3600)
+    return {'tables_packb': lambda: msgpack.packb(tables), 'tables_unpackb': lambda: msgpack.unpackb(raw_tables), 'fights_packb': lambda: msgpack.packb(fights), 'fights_unpackb': lambda: msgpack.unpackb(raw_fights), 'tables_envelope_pack': lambda: _pack(tables, 3600), 'tables_envelope_unpack': lambda: _unpack(packed_tables), 'fights_envelope_unpack': lambda: _unpack(packed_fights), 'tables_project': lambda: projections.tables(tables), 'fights_project': lambda: projections.fights(fights), 'tables_projected_envelope_unpack': lambda: _unpack(packed_projected_tables)}
@@ -0,0 +1,18 @@
+from harness import fixture, run_sync
+
+from classes import Player
+from guildconfigparser import GuildConfigParser
+
+
+def benchmarks():
+    parses = fixture('parses')
+    guildconfig = GuildConfigParser(None, 0)
+    guildconfig.read_dict(fixture('guildconfig'))
+    player = Player(guildconfig, None, None, 10, 60, 'Aerith')
+
+    def filter_encounters():
+        player.edl = {0: 0}
+        player.tpl = {0: 0}
+        run_sync(player.filter_last_encounters(parses))
+
+    return {'filter_last_encounters': filter_encounters}
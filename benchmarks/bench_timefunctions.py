@@ -0,0 +1,32 @@
+from harness import fixture
+
+from timefunctions import convert_time, elapsedTime, fix_item_time, fix_news_time
+
+TIMEZONE = 'America/Los_Angeles'
+
+
+def benchmarks():
+    times = fixture('times')
+    epochs = times['epoch']
+
+    def convert():
+        for epoch in epochs:
+            convert_time(epoch, dateonly=True, tz=TIMEZONE)
+
+    def convert_notz():
+        for epoch in epochs:
+            convert_time(epoch)
+
+    def item_time():
+        for rawtime in times['item']:
+            fix_item_time(rawtime, TIMEZONE)
+
+    def news_time():
+        for rawtime in times['news']:
+            fix_news_time(rawtime, TIMEZONE)
+
+    def elapsed():
+        for num in range(1, len(epochs)):
+            elapsedTime(epochs[0], epochs[num])
+
+    return {'convert_time': convert, 'convert_time_utc': convert_notz, 'fix_item_time': item_time, 'fix_news_time': news_time, 'elapsedTime': elapsed}
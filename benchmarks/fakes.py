@@ -0,0 +1,244 @@
+from asyncio import Queue, TimeoutError, wait_for
+from time import monotonic
+from types import SimpleNamespace
+
+
+def _key(key):
+    return key if isinstance(key, str) else str(key)
+
+
+def _bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+
+class FakeRedis:
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.channels = {}
+        self.commands = 0
+
+    def _alive(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    async def ping(self):
+        return True
+
+    async def get(self, key):
+        self.commands += 1
+        key = _key(key)
+        return self.data[key] if self._alive(key) else None
+
+    async def set(self, key, value, ex=None, px=None, nx=False):
+        self.commands += 1
+        key = _key(key)
+        if nx and self._alive(key):
+            return None
+        self.data[key] = _bytes(value)
+        self.expires.pop(key, None)
+        if ex is not None:
+            self.expires[key] = monotonic() + ex
+        elif px is not None:
+            self.expires[key] = monotonic() + px / 1000
+        return True
+
+    async def delete(self, *keys):
+        self.commands += 1
+        removed = 0
+        for key in map(_key, keys):
+            if self._alive(key):
+                removed += 1
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return removed
+
+    async def exists(self, key):
+        self.commands += 1
+        return 1 if self._alive(_key(key)) else 0
+
+    async def pttl(self, key):
+        self.commands += 1
+        key = _key(key)
+        if not self._alive(key):
+            return -2
+        if key not in self.expires:
+            return -1
+        return int((self.expires[key] - monotonic()) * 1000)
+
+    async def expire(self, key, seconds):
+        self.commands += 1
+        key = _key(key)
+        if not self._alive(key):
+            return 0
+        self.expires[key] = monotonic() + seconds
+        return 1
+
+    async def eval(self, script, numkeys, *args):
+        self.commands += 1
+        key, token = _key(args[0]), _bytes(args[1])
+        if self._alive(key) and self.data[key] == token:
+            return await self.delete(key)
+        return 0
+
+    async def hset(self, key, field, value):
+        self.commands += 1
+        self.data.setdefault(_key(key), {})[_bytes(field)] = _bytes(value)
+        return 1
+
+    async def hdel(self, key, *fields):
+        self.commands += 1
+        mapping = self.data.get(_key(key), {})
+        return sum(1 for field in fields if mapping.pop(_bytes(field), None) is not None)
+
+    async def hgetall(self, key):
+        self.commands += 1
+        key = _key(key)
+        return dict(self.data[key]) if self._alive(key) else {}
+
+    async def hincrby(self, key, field, amount=1):
+        self.commands += 1
+        mapping = self.data.setdefault(_key(key), {})
+        value = int(mapping.get(_bytes(field), 0)) + amount
+        mapping[_bytes(field)] = _bytes(value)
+        return value
+
+    async def publish(self, channel, message):
+        self.commands += 1
+        for queue in self.channels.get(channel, ()):
+            queue.put_nowait({'type': 'message', 'channel': channel.encode(), 'data': _bytes(message)})
+        return len(self.channels.get(channel, ()))
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+    async def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.queued = []
+
+    def __getattr__(self, name):
+        command = getattr(self.redis, name)
+
+        async def queue(*args, **kwargs):
+            self.queued.append((command, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        results = [await command(*args, **kwargs) for command, args, kwargs in self.queued]
+        self.queued = []
+        return results
+
+
+class FakePubSub:
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.queue = Queue()
+
+    async def subscribe(self, *channels):
+        for channel in channels:
+            self.redis.channels.setdefault(channel, []).append(self.queue)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0):
+        try:
+            return await wait_for(self.queue.get(), timeout)
+        except TimeoutError:
+            return None
+
+
+class FakeRedisPool:
+
+    backends = {}
+
+    def __init__(self, socket, host, port, db, **kwargs):
+        self.db = db
+        self.redis = self.backends.setdefault(db, FakeRedis())
+        self.pool = SimpleNamespace(_available_connections=[None], _in_use_connections=set(), _created_connections=1, max_connections=1)
+        self.connected = True
+
+    async def connect(self):
+        self.connected = True
+
+    async def disconnect(self):
+        self.connected = False
+
+    def usage(self):
+        return {'created': 1, 'available': 1, 'in_use': 0, 'max': 1}
+
+
+class FakeChannel:
+
+    def __init__(self, channel_id, sink):
+        self.id = channel_id
+        self.name = f'channel-{channel_id}'
+        self.sink = sink
+
+    async def send(self, embed=None, content=None):
+        self.sink.append(embed)
+        return FakeSent()
+
+    async def trigger_typing(self):
+        pass
+
+    def __str__(self):
+        return self.name
+
+
+class FakeSent:
+
+    async def delete(self):
+        pass
+
+
+class FakeUser:
+
+    def __init__(self, user_id, name, roles=(), sink=None):
+        self.id = user_id
+        self.name = name
+        self.roles = list(roles)
+        self.sink = sink if sink is not None else []
+
+    async def send(self, embed=None, content=None):
+        self.sink.append(embed)
+        return FakeSent()
+
+    def __str__(self):
+        return f'{self.name}#0001'
+
+
+class FakeGuild:
+
+    def __init__(self, guild_id, name, role_id, users):
+        self.id = guild_id
+        self.name = name
+        role = SimpleNamespace(id=role_id, name='Raider')
+        self.members = {user_id: FakeUser(user_id, f'User{user_id}', roles=[role]) for user_id in users}
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+
+class FakeMessage:
+
+    def __init__(self, content, user_id, guild, channel_id):
+        self.sent = []
+        self.content = content
+        self.author = FakeUser(user_id, f'User{user_id}', sink=self.sent)
+        self.channel = FakeChannel(channel_id, self.sent)
+        self.guild = guild
+
+    async def delete(self):
+        pass
@@ -0,0 +1,44 @@
+import json
+import sys
+from pathlib import Path
+from statistics import median
+from timeit import Timer
+
+ROOT = Path(__file__).resolve().parent
+FIXTURES = ROOT / 'fixtures'
+
+sys.path.insert(0, str(ROOT.parent))
+
+
+def fixture(name):
+    with (FIXTURES / f'{name}.json').open('r') as fixturefile:
+        return json.load(fixturefile)
+
+
+def run_sync(coro):
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise RuntimeError('Benchmark coroutine suspended, it cannot be driven synchronously')
+
+
+def measure(func, rounds=5):
+    timer = Timer(func)
+    number, _ = timer.autorange()
+    per = [elapsed / number * 1e9 for elapsed in timer.repeat(repeat=rounds, number=number)]
+    return {'ns_per_op': min(per), 'median_ns': median(per), 'number': number, 'rounds': rounds}
+
+
+class FixtureRedis:
+
+    def __init__(self, data=None):
+        self.data = data or {}
+        self.connected = True
+        self.redis = self
+        self.pool = self
+        self._available_connections = [None]
+
+    async def get(self, key):
+        return self.data.get(key)
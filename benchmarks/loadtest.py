@@ -0,0 +1,225 @@
+import argparse
+import asyncio
+import json
+import socket
+import sys
+import tempfile
+from collections import Counter, defaultdict
+from configparser import ConfigParser
+from os import chdir, environ
+from pathlib import Path
+from random import Random
+from time import monotonic
+
+from harness import ROOT, fixture
+
+import cachemanager
+import classes
+import datafetch
+from constants import FAIL_COLOR
+from fakes import FakeGuild, FakeMessage, FakeRedisPool, FakeUser
+from stubs import Upstream
+
+import msgpack
+import uvloop
+from loguru import logger as log
+
+MIX = 'player=30,gear=20,raids=15,item=20,news=10,status=5'
+COMMANDS = {'player': '=player {player}', 'gear': '=gear {player}', 'raids': '=raids', 'item': '=item {item}', 'news': '=news', 'status': '=status'}
+ITEM_NAMES = ('staff of dominance', 'lionheart helm', 'band of accuria', 'onslaught girdle', 'drake fang talisman')
+BOT_ID = 1
+USER_ROLE_ID = 345678901234567890
+FIRST_USER = 1000
+
+
+def parse_mix(mix):
+    weights = {}
+    for entry in mix.split(','):
+        name, weight = entry.strip().split('=')
+        if name not in COMMANDS:
+            raise SystemExit(f'Unknown command [{name}] in mix, choose from: {", ".join(COMMANDS)}')
+        weights[name] = float(weight)
+    return weights
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def write_config(directory, port, args):
+    base = f'http://127.0.0.1:{port}'
+    config = ConfigParser()
+    config.read_dict({'general': {'logfile': str(directory / 'loadtest.log'), 'redis_socket': 'None', 'cache_socket': 'None', 'redis_host': '127.0.0.1', 'cache_host': '127.0.0.1', 'redis_port': '6379', 'cache_port': '6379', 'config_db': '1', 'cache_db': '2'},
+                      'threshold': {'news': '30', 'parses': '10', 'tables': '60', 'fights': '60', 'stale': '60'},
+                      'discord': {'api_key': 'loadtest', 'dev_key': 'loadtest', 'superadmin_id': '0'},
+                      'warcraftlogs': {'api_url': f'{base}/wcl/'},
+                      'blizzard': {'api_url': f'{base}/', 'client_id': 'loadtest', 'secret': 'loadtest'},
+                      'tsm': {'api_url': f'{base}/nexus/'},
+                      'http': {'limit_per_host': str(args.connections), 'retries': str(args.retries), 'hedge': str(args.hedge).lower()},
+                      'ratelimit': {'warcraftlogs': args.ratelimit, 'blizzard': args.ratelimit, 'nexus': args.ratelimit},
+                      'catalog': {'file': str(directory / 'items.catalog')}})
+    configfile = directory / 'wowinfobot.cfg'
+    with configfile.open('w') as cfgfile:
+        config.write(cfgfile)
+    return configfile
+
+
+def seed_guilds(guilds, users):
+    guildconfig = fixture('guildconfig')
+    guildconfig['discord']['user_role_id'] = str(USER_ROLE_ID)
+    configdb = FakeRedisPool(None, None, None, '1').redis
+    fakeguilds = []
+    for num in range(guilds):
+        guild_id = 500000000000000000 + num
+        configdb.data[str(guild_id)] = msgpack.packb(guildconfig)
+        fakeguilds.append(FakeGuild(guild_id, f'Guild {num}', USER_ROLE_ID, range(FIRST_USER, FIRST_USER + users)))
+    return fakeguilds
+
+
+def weighted(pool, rand):
+    weights = [1 / (rank + 1) for rank in range(len(pool))]
+    return lambda: rand.choices(pool, weights)[0]
+
+
+def failed(embed):
+    return embed is not None and getattr(embed.colour, 'value', None) == FAIL_COLOR
+
+
+def percentile(values, q):
+    if len(values) == 0:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summary(latencies):
+    latencies = sorted(latencies)
+    return {'count': len(latencies), 'p50': percentile(latencies, 0.50), 'p95': percentile(latencies, 0.95), 'p99': percentile(latencies, 0.99), 'max': latencies[-1] if latencies else 0.0}
+
+
+async def drive(botmodule, guilds, args):
+    rand = Random(args.seed)
+    mix = parse_mix(args.mix)
+    commands = list(mix)
+    players = weighted([entry['name'] for entry in fixture('tables')['entries']][:args.players], rand)
+    items = weighted([str(13900 + num) for num in range(args.items)] + list(ITEM_NAMES), rand)
+    latencies = defaultdict(list)
+    failures = Counter()
+    inflight = set()
+
+    async def one(name, message):
+        start = monotonic()
+        try:
+            await botmodule.on_message(message)
+        except:
+            log.exception(f'Load test message [{message.content}] raised')
+            failures[name] += 1
+        else:
+            if len(message.sent) == 0 or any(failed(embed) for embed in message.sent):
+                failures[name] += 1
+        latencies[name].append(monotonic() - start)
+
+    interval = 1 / args.rate
+    started = monotonic()
+    deadline = started + args.duration
+    sent = 0
+    while monotonic() < deadline:
+        name = rand.choices(commands, [mix[command] for command in commands])[0]
+        content = COMMANDS[name].format(player=players(), item=items())
+        guild = rand.choice(guilds)
+        message = FakeMessage(content, FIRST_USER + rand.randrange(args.users), guild, guild.id + 1)
+        task = asyncio.ensure_future(one(name, message))
+        inflight.add(task)
+        task.add_done_callback(inflight.discard)
+        sent = sent + 1
+        wait = started + sent * interval - monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+    if inflight:
+        await asyncio.wait(set(inflight), timeout=args.drain)
+    elapsed = monotonic() - started
+    return {'sent': sent, 'completed': sum(len(values) for values in latencies.values()), 'unfinished': len(inflight), 'elapsed': elapsed, 'latencies': latencies, 'failures': failures}
+
+
+def report(result, upstream, cachestats, args):
+    completed = result['completed']
+    overall = summary([value for values in result['latencies'].values() for value in values])
+    commands = {name: dict(summary(values), failed=result['failures'][name]) for name, values in sorted(result['latencies'].items())}
+    lookups = sum(cachestats.values())
+    hits = cachestats['l1_hit'] + cachestats['redis_hit']
+    return {'target_rate': args.rate, 'duration': args.duration, 'sent': result['sent'], 'completed': completed, 'unfinished': result['unfinished'], 'throughput': completed / result['elapsed'] if result['elapsed'] > 0 else 0.0,
+            'latency': overall, 'commands': commands,
+            'cache': {'lookups': lookups, 'hit_ratio': hits / lookups if lookups else 0.0, 'results': dict(cachestats)},
+            'upstream': {'calls': sum(upstream.counts.values()), 'errors': sum(upstream.errors.values()), 'routes': dict(sorted(upstream.counts.items())), 'route_errors': dict(upstream.errors), 'bytes': dict(upstream.bytes)},
+            'redis_commands': {db: backend.commands for db, backend in FakeRedisPool.backends.items()}}
+
+
+def print_report(results):
+    print(f"\nSent {results['sent']} messages in {results['duration']}s at {results['target_rate']}/s, completed {results['completed']} ({results['unfinished']} unfinished)")
+    print(f"Throughput: {results['throughput']:.1f} commands/s")
+    print(f'\n{"command":<10} {"count":>7} {"failed":>7} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"max ms":>9}')
+    for name, stats in list(results['commands'].items()) + [('all', dict(results['latency'], failed=sum(stats['failed'] for stats in results['commands'].values())))]:
+        print(f"{name:<10} {stats['count']:>7} {stats['failed']:>7} {stats['p50'] * 1000:>9.1f} {stats['p95'] * 1000:>9.1f} {stats['p99'] * 1000:>9.1f} {stats['max'] * 1000:>9.1f}")
+    cache = results['cache']
+    print(f"\nCache: {cache['lookups']} lookups, hit ratio {cache['hit_ratio']:.1%} {cache['results']}")
+    upstream = results['upstream']
+    print(f"Upstream: {upstream['calls']} calls, {upstream['errors']} injected errors")
+    for route, count in upstream['routes'].items():
+        print(f"  {route:<24} {count:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WoWInfoBot end-to-end load test with stub upstreams and a fake gateway')
+    parser.add_argument('--rate', type=float, default=50, help='target messages per second')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to generate traffic for')
+    parser.add_argument('--drain', type=float, default=30, help='seconds to wait for in-flight commands afterwards')
+    parser.add_argument('--mix', default=MIX, help='command weights, e.g. player=30,gear=20,raids=15,item=20,news=10,status=5')
+    parser.add_argument('--guilds', type=int, default=20)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--players', type=int, default=40, help='distinct character names, requested with a skewed distribution')
+    parser.add_argument('--items', type=int, default=100, help='distinct item ids, requested with a skewed distribution')
+    parser.add_argument('--latency', type=float, default=50, help='mean upstream latency in ms')
+    parser.add_argument('--jitter', type=float, default=20, help='upstream latency standard deviation in ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of upstream requests answered with a 503')
+    parser.add_argument('--payload-scale', type=int, default=1, help='multiply list payloads to simulate larger responses')
+    parser.add_argument('--connections', type=int, default=10, help='http connections per upstream host')
+    parser.add_argument('--retries', type=int, default=2)
+    parser.add_argument('--hedge', action='store_true')
+    parser.add_argument('--ratelimit', default='1000/1000', help='rate/burst applied to every upstream api')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', type=Path, help='write results JSON to this file')
+    args = parser.parse_args()
+    sys.argv = sys.argv[:1]
+
+    port = free_port()
+    workdir = Path(tempfile.mkdtemp(prefix='wowinfobot-loadtest-'))
+    environ['WOWINFOBOT_CONFIG'] = str(write_config(workdir, port, args))
+    environ.pop('WOWINFOBOT_SHARD_IDS', None)
+    classes.RedisPool = FakeRedisPool
+    datafetch.BLIZZARD_URL = f'http://127.0.0.1:{port}'
+    datafetch.BLIZZARD_AUTHURL = f'http://127.0.0.1:{port}/oauth/token'
+    uvloop.install()
+    chdir(ROOT.parent)
+    import bot
+    log.remove()
+    log.add(sink=sys.stderr, level='WARNING', filter=lambda record: 'trace' not in record['extra'])
+    bot.bot._connection.user = FakeUser(BOT_ID, 'WoWInfoBot')
+
+    upstream = Upstream(latency=args.latency / 1000, jitter=args.jitter / 1000, error_rate=args.error_rate, factor=args.payload_scale)
+    guilds = seed_guilds(args.guilds, args.users)
+    loop = bot.bot.loop
+    loop.run_until_complete(upstream.start('127.0.0.1', port))
+    try:
+        result = loop.run_until_complete(drive(bot, guilds, args))
+        results = report(result, upstream, cachemanager.cachestats, args)
+    finally:
+        loop.run_until_complete(bot.clientmanager.close())
+        loop.run_until_complete(upstream.stop())
+    print_report(results)
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import importlib
+import json
+import platform
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from harness import ROOT, measure
+
+from loguru import logger as log
+
+MODULES = ('bench_dispatch', 'bench_formatting', 'bench_timefunctions', 'bench_payloads', 'bench_player', 'bench_guildconfig', 'bench_itemcatalog')
+BASELINE = ROOT / 'baseline.json'
+
+
+def run(selected, rounds):
+    results = {}
+    for modulename in MODULES:
+        try:
+            module = importlib.import_module(modulename)
+        except ImportError as error:
+            print(f'{modulename[6:] + ".*":<45} {"skipped":>14} ({error})', flush=True)
+            continue
+        for name, func in module.benchmarks().items():
+            fullname = f'{modulename[6:]}.{name}'
+            if selected and not any(select in fullname for select in selected):
+                continue
+            results[fullname] = measure(func, rounds=rounds)
+            print(f'{fullname:<45} {results[fullname]["ns_per_op"]:>14.1f} ns/op', flush=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = {}
+    print(f'\n{"benchmark":<45} {"baseline":>14} {"current":>14} {"change":>9}')
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]['ns_per_op']
+        change = (result['ns_per_op'] - before) / before
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions[name] = change
+        elif change < -threshold:
+            flag = '  improved'
+        print(f'{name:<45} {before:>14.1f} {result["ns_per_op"]:>14.1f} {change:>+8.1%}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WoWInfoBot microbenchmarks')
+    parser.add_argument('select', nargs='*', help='only run benchmarks whose name contains one of these strings')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--output', type=Path, help='write results JSON to this file')
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--threshold', type=float, default=0.25, help='relative slowdown flagged as a regression')
+    parser.add_argument('--update-baseline', action='store_true', help='merge these results into the baseline file instead of failing on regressions')
+    args = parser.parse_args()
+
+    log.remove()
+    results = run(args.select, args.rounds)
+    report = {'created': datetime.utcnow().isoformat(), 'python': platform.python_version(), 'platform': platform.platform(), 'results': results}
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2))
+    regressions = {}
+    if args.baseline.exists():
+        regressions = compare(results, json.loads(args.baseline.read_text())['results'], args.threshold)
+    elif not args.update_baseline:
+        print(f'\nNo baseline at {args.baseline}, run with --update-baseline to record one')
+    if args.update_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else dict(report, results={})
+        baseline.update(created=report['created'], python=report['python'], platform=report['platform'])
+        baseline['results'].update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2))
+        print(f'\nBaseline updated: {args.baseline}')
+    elif regressions:
+        print(f'\n{len(regressions)} regression(s) over {args.threshold:.0%}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import json
+from asyncio import sleep
+from collections import Counter
+from random import gauss, random
+
+from aiohttp import web
+
+from harness import fixture
+
+SCALED = ('entries', 'fights', 'composition')
+
+
+def scale(payload, factor):
+    if factor <= 1:
+        return payload
+    if isinstance(payload, list):
+        return payload * factor
+    return {key: value * factor if key in SCALED and isinstance(value, list) else value for key, value in payload.items()}
+
+
+class Upstream:
+
+    def __init__(self, latency=0.05, jitter=0.02, error_rate=0.0, factor=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.counts = Counter()
+        self.errors = Counter()
+        self.bytes = Counter()
+        self.payloads = {name: json.dumps(scale(fixture(name), factor)).encode() for name in ('parses', 'tables', 'fights', 'reports', 'realm', 'price', 'news')}
+        self.payloads['search'] = json.dumps([{'itemId': 13937, 'name': 'Staff of Dominance', 'uniqueName': 'staff-of-dominance'}]).encode()
+        self.payloads['token'] = json.dumps({'access_token': 'loadtest', 'token_type': 'bearer', 'expires_in': 86399}).encode()
+        self.runner = None
+
+    async def respond(self, route, payload):
+        self.counts[route] += 1
+        await sleep(max(0.0, gauss(self.latency, self.jitter)))
+        if payload != 'token' and random() < self.error_rate:
+            self.errors[route] += 1
+            return web.Response(status=503, text='Service Unavailable')
+        body = self.payloads[payload]
+        self.bytes[route] += len(body)
+        return web.Response(body=body, content_type='application/json')
+
+    def app(self):
+        routes = {'/wcl/parses/character/{name}/{server}/{region}': ('wcl.parses', 'parses'),
+                  '/wcl/report/tables/{view}/{code}': ('wcl.tables', 'tables'),
+                  '/wcl/report/fights/{code}': ('wcl.fights', 'fights'),
+                  '/wcl/reports/guild/{name}/{server}/{region}': ('wcl.guild', 'reports'),
+                  '/data/wow/connected-realm/{realm_id}': ('blizzard.realm_status', 'realm'),
+                  '/nexus/items/{server}/{itemid}': ('nexus.price', 'price'),
+                  '/nexus/search': ('nexus.search', 'search'),
+                  '/nexus/news': ('nexus.news', 'news')}
+        app = web.Application()
+        for path, (route, payload) in routes.items():
+            app.router.add_get(path, self._handler(route, payload))
+        app.router.add_post('/oauth/token', self._handler('blizzard.token', 'token'))
+        return app
+
+    def _handler(self, route, payload):
+        async def handler(request):
+            return await self.respond(route, payload)
+        return handler
+
+    async def start(self, host, port):
+        self.runner = web.AppRunner(self.app(), access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
@@ -1,37 +1,64 @@
 #!/usr/bin/env python3.8
+import asyncio
 import signal
 from configparser import ConfigParser
-from math import trunc
+from functools import partial
 from numbers import Number
-from os import _exit, path, stat
+from os import _exit, environ, path, stat
+from time import monotonic
 from pathlib import Path
 from sys import argv, exit, stdout
-from cachemanager import getcache, putcache
+from cachemanager import fillcache, get_many, getcache, invalidation_listener, servedstale, setup_cache, track_stale
+from circuitbreaker import setup_breakers
+from latency import setup_latency
+import metrics
+from tracing import setup_tracing, span, trace
+import tape
+import usage
 import discord
 from discord.ext import commands
-from fuzzywuzzy import fuzz
 from loguru import logger as log
-from prettyprinter import pprint
 import uvloop
-from classes import Item, Player, RedisPool
-from constants import (BOSSREF, BZONE, COMMAND_PREFIXES, FAIL_COLOR, GEAR_ORDER, HELP_COLOR, INFO_COLOR, RZONE,
-                       SUCCESS_COLOR, VALID_COMMANDS)
-from datafetch import BlizzardAPI, NexusAPI, WarcraftLogsAPI
-from guildconfigparser import GuildConfigParser
+from classes import Item, MemberIndex, MessageContext, Player, RedisPool, SetupSessions, SharedMemberIndex
+from constants import (BOSSREF, BZONE, COMMAND_ALIASES, COMMAND_PREFIXES, FAIL_COLOR, FETCH_CONCURRENCY, GEAR_ORDER,
+                       HELP_COLOR, INFO_COLOR, RATE_LIMITS, RZONE, SUCCESS_COLOR)
+from datafetch import BlizzardTokenStore, ClientManager
+from formatfunctions import convertprice, filter_details, truncate_float
+from dispatch import CommandRegistry
+from guildconfigparser import GuildConfigParser, config_listener
+from itemcatalog import ItemCatalog, catalog_flusher
 from processlock import PLock
+from projections import cachekey, fightsummary, projected
+from ratelimit import RateLimiter
 from timefunctions import convert_time, elapsedTime, fix_item_time, fix_news_time
 
-fuzzy_command_error = 75
+fight_timeout = 8
 
-configfile = '/etc/wowinfobot.cfg'
+STALE_FOOTER = 'Showing cached data, may be out of date'
+
+configfile = environ.get('WOWINFOBOT_CONFIG', '/etc/wowinfobot.cfg')
+cluster_id = environ.get('WOWINFOBOT_CLUSTER_ID')
+shard_ids = [int(shard_id) for shard_id in environ.get('WOWINFOBOT_SHARD_IDS', '').split(',') if shard_id.strip() != '']
+shard_count = int(environ.get('WOWINFOBOT_SHARD_COUNT', len(shard_ids)))
 signals = (0, 'SIGHUP', 'SIGINT', 'SIGQUIT', 4, 5, 6, 7, 8, 'SIGKILL', 10, 11, 12, 13, 14, 'SIGTERM')
 
 
+async def shutdown():
+    await usage.flush(redis)
+    tape.flush()
+    catalog.save()
+    await clientmanager.close()
+    await bot.close()
+
+
 def signal_handler(signal, frame):
     log.warning(f'Termination signal [{signals[signal]}] caught. Closing web sessions...')
-    tsmclient.close()
-    log.info(f'Exiting.')
-    exit(0)
+    if bot.loop.is_running():
+        bot.loop.call_soon_threadsafe(bot.loop.create_task, shutdown())
+    else:
+        bot.loop.run_until_complete(clientmanager.close())
+        log.info(f'Exiting.')
+        exit(0)
 
 
 signal.signal(signal.SIGTERM, signal_handler)  # Graceful Shutdown
@@ -47,8 +74,13 @@ for line in content:
         BRANCH = line.partition("refs/heads/")[2]
 
 if BRANCH != 'develop':
-    processlock = PLock()
-    processlock.lock()
+    if shard_ids:
+        processlocks = [PLock(f'shard{shard_id}') for shard_id in shard_ids]
+        for processlock in processlocks:
+            processlock.lock()
+    else:
+        processlock = PLock()
+        processlock.lock()
 
 if not path.exists(configfile) or stat(configfile).st_size == 0:
     log.error(f"Config file: {configfile} doesn't exist or is empty. Exiting.")
@@ -82,6 +114,10 @@ news_thresh = systemconfig.get("threshold", "news")
 parses_thresh = systemconfig.get("threshold", "parses")
 tables_thresh = systemconfig.get("threshold", "tables")
 fights_thresh = systemconfig.get("threshold", "fights")
+reports_thresh = systemconfig.getint("threshold", "reports", fallback=10)
+localcache_size = systemconfig.getint("cache", "local_size", fallback=1024)
+localcache_ttl = systemconfig.getint("cache", "local_ttl", fallback=60)
+stale_thresh = systemconfig.getint("threshold", "stale", fallback=60)
 discordkey = systemconfig.get("discord", "api_key")
 discordkey_dev = systemconfig.get("discord", "dev_key")
 superadmin_id = systemconfig.get("discord", "superadmin_id")
@@ -89,6 +125,33 @@ bliz_int_client = systemconfig.get("blizzard", "client_id")
 bliz_int_secret = systemconfig.get("blizzard", "secret")
 wcl_url = systemconfig.get("warcraftlogs", "api_url")
 tsm_url = systemconfig.get("tsm", "api_url")
+http_limit = systemconfig.getint("http", "limit_per_host", fallback=10)
+http_dns_cache = systemconfig.getint("http", "dns_cache", fallback=300)
+http_keepalive = systemconfig.getint("http", "keepalive", fallback=30)
+http_host_limits = systemconfig.get("http", "host_limits", fallback="")
+http_retries = systemconfig.getint("http", "retries", fallback=2)
+http_hedge = systemconfig.getboolean("http", "hedge", fallback=False)
+trace_rate = systemconfig.getfloat("tracing", "sample_rate", fallback=0)
+trace_slow = systemconfig.getfloat("tracing", "slow", fallback=0)
+tape_mode = systemconfig.get("tape", "mode", fallback="off").lower()
+tape_file = Path(systemconfig.get("tape", "file", fallback="/var/lib/wowinfobot/upstream.tape"))
+tape_scale = systemconfig.getfloat("tape", "latency_scale", fallback=1.0)
+catalog_file = systemconfig.get("catalog", "file", fallback="/var/lib/wowinfobot/items.catalog")
+catalog_seed = systemconfig.get("catalog", "seed", fallback="")
+catalog_threshold = systemconfig.getfloat("catalog", "threshold", fallback=0.8)
+metrics_enabled = systemconfig.getboolean("metrics", "enabled", fallback=False)
+metrics_host = systemconfig.get("metrics", "host", fallback="127.0.0.1")
+metrics_port = systemconfig.getint("metrics", "port", fallback=9120)
+latency_window = systemconfig.getint("latency", "window", fallback=200)
+latency_samples = systemconfig.getint("latency", "min_samples", fallback=20)
+latency_factor = systemconfig.getfloat("latency", "timeout_factor", fallback=3)
+latency_floor = systemconfig.getfloat("latency", "min_timeout", fallback=1)
+latency_ceiling = systemconfig.getfloat("latency", "max_timeout", fallback=10)
+latency_default = systemconfig.getfloat("latency", "default_timeout", fallback=5)
+circuit_window = systemconfig.getint("circuit", "window", fallback=60)
+circuit_minimum = systemconfig.getint("circuit", "minimum", fallback=10)
+circuit_threshold = systemconfig.getfloat("circuit", "threshold", fallback=0.5)
+circuit_cooldown = systemconfig.getint("circuit", "cooldown", fallback=30)
 
 consoleformat = "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green>| <level>{level: <8}</level> | <level>{message}</level> |<cyan>{function}</cyan>:<cyan>{line}</cyan>"
 logformat = "{time:YYYY-MM-DD HH:mm:ss.SSS}| {level: <8} | {message} |{function}:{line}"
@@ -99,14 +162,28 @@ log.level("TRACE", color="<fg 245>")
 
 if len(argv) > 1 or BRANCH == "develop":
     ll = "TRACE"
-    log.add(sink=stdout, level=ll, format=consoleformat, colorize=True)
+    log.add(sink=stdout, level=ll, format=consoleformat, colorize=True, filter=lambda record: 'trace' not in record['extra'])
     if BRANCH == "develop":
         devfile = logfile.stem + "-dev" + logfile.suffix
         logfile = logfile.parent / devfile
 else:
     ll = "INFO"
 
-log.add(sink=str(logfile), level=ll, buffering=1, enqueue=True, backtrace=True, format=logformat, diagnose=True, serialize=False, delay=False, colorize=False, rotation="5 MB", retention="1 month", compression="tar.gz")
+if cluster_id is not None:
+    clusterfile = logfile.stem + f"-cluster{cluster_id}" + logfile.suffix
+    logfile = logfile.parent / clusterfile
+
+log.add(sink=str(logfile), level=ll, buffering=1, enqueue=True, backtrace=True, format=logformat, diagnose=True, serialize=False, delay=False, colorize=False, rotation="5 MB", retention="1 month", compression="tar.gz", filter=lambda record: 'trace' not in record['extra'])
+
+if trace_rate > 0 or trace_slow > 0:
+    tracefile = logfile.parent / (logfile.stem + "-traces.jsonl")
+    log.add(sink=str(tracefile), level="INFO", enqueue=True, format="{message}", serialize=False, colorize=False, rotation="20 MB", retention="1 week", compression="tar.gz", filter=lambda record: 'trace' in record['extra'])
+    setup_tracing(trace_rate, trace_slow)
+
+if tape_mode in (tape.CAPTURE, tape.REPLAY):
+    if cluster_id is not None and tape_mode == tape.CAPTURE:
+        tape_file = tape_file.parent / (tape_file.stem + f"-cluster{cluster_id}" + tape_file.suffix)
+    tape.setup_tape(tape_mode, str(tape_file), tape_scale)
 
 log.debug(f'System configuration loaded successfully from {configfile}')
 log.debug(f'Logfile started: {logfile}')
@@ -116,7 +193,11 @@ if BRANCH == 'develop':
 else:
     log.info(f'WoWInfoClassic Bot is starting in PRODUCTION MODE!')
 
-bot = commands.Bot(command_prefix="=", case_insensitive=True)
+if shard_ids:
+    bot = commands.AutoShardedBot(command_prefix="=", case_insensitive=True, shard_ids=shard_ids, shard_count=shard_count)
+    log.info(f'Cluster [{cluster_id}] running shards {shard_ids} of [{shard_count}]')
+else:
+    bot = commands.Bot(command_prefix="=", case_insensitive=True)
 bot.remove_command("help")
 log.debug('Discord class initalized')
 
@@ -125,130 +206,129 @@ rediscache = RedisPool(cache_socket, cache_host, cache_port, cache_db)
 bot.loop.create_task(redis.connect())
 bot.loop.create_task(rediscache.connect())
 
-tsmclient = NexusAPI(tsm_url)
+setup_cache(localcache_size, localcache_ttl, 60 * stale_thresh)
+setup_breakers(circuit_window, circuit_minimum, circuit_threshold, circuit_cooldown)
+setup_latency(latency_window, latency_samples, latency_factor, latency_floor, latency_ceiling, latency_default)
+bot.loop.create_task(invalidation_listener(rediscache))
+bot.loop.create_task(config_listener(redis))
+
+host_limits = {}
+for entry in http_host_limits.split(','):
+    if ':' in entry:
+        host, limit = entry.strip().rsplit(':', 1)
+        host_limits[host] = int(limit)
+rate_limits = dict(RATE_LIMITS)
+for api in rate_limits:
+    if systemconfig.has_option("ratelimit", api):
+        rate, burst = systemconfig.get("ratelimit", api).split('/')
+        rate_limits[api] = (float(rate), int(burst))
+clientmanager = ClientManager(limit_per_host=http_limit, dns_cache=http_dns_cache, keepalive=http_keepalive, host_limits=host_limits, tokens=BlizzardTokenStore(rediscache), limiter=RateLimiter(rate_limits), retries=http_retries, hedge=http_hedge)
+log.debug('ClientManager class initalized')
+
+tsmclient = clientmanager.nexus(tsm_url)
 log.debug('NexusAPI class initalized')
 
-running_setup = {}
-
-
-def truncate_float(number, digits):
-    if not isinstance(number, (float, str)):
-        number = float(number)
-    if not isinstance(digits, int):
-        raise TypeError(f"Digits value must be type int, not {type(digits)}")
-    if isinstance(number, str):
-        number = float(number)
-    stepper = 10.0 ** abs(digits)
-    return trunc(stepper * number) / stepper
-
-
-def convertprice(rawprice):
-    if rawprice is None:
-        return 'Not Available'
-    if rawprice == 'Not Available':
-        return 'Not Available'
-    if rawprice < 100:
-        return f'{rawprice}c'
-    elif rawprice >= 100 and rawprice < 10000:
-        silver = int(str(rawprice)[:-2])
-        copper = int(str(rawprice)[-2:])
-        return f'{silver}s {copper}c'
-    elif rawprice >= 10000:
-        silver = int(str(rawprice)[:-2])
-        silver = int(str(silver)[-2:])
-        copper = int(str(rawprice)[-2:])
-        gold = int(str(rawprice)[:-4])
-        return f'{gold}g {silver}s {copper}c'
-
-
-def fuzzycmdlookup(cmd):
-    ratios = {}
-    for command in VALID_COMMANDS:
-        ratio = fuzz.ratio(command, cmd)
-        ratios[command] = ratio
-    v = list(ratios.values())
-    k = list(ratios.keys())
-    if max(v) >= fuzzy_command_error:
-        if max(v) != 100:
-            log.debug(f'Fuzzy cmd lookup: {sorted(ratios.items())}')
-            log.info(f'Fuzzy command fixed [{cmd} -> {k[v.index(max(v))]}] [{max(v)}%]')
-        return k[v.index(max(v))]
-    else:
-        log.debug(f'Fuzzy cmd lookup: {sorted(ratios.items())}')
-        return None
+catalog = ItemCatalog(catalog_file, threshold=catalog_threshold)
+if catalog_seed != "" and path.exists(catalog_seed):
+    catalog.seed(catalog_seed)
+    catalog.save()
+bot.loop.create_task(catalog_flusher(catalog))
+if tape.capturing():
+    bot.loop.create_task(tape.tape_flusher())
+log.debug(f'ItemCatalog loaded with [{len(catalog)}] items')
+
+if shard_ids:
+    memberindex = SharedMemberIndex(redis)
+else:
+    memberindex = MemberIndex()
+commandregistry = CommandRegistry()
+
+setupsessions = SetupSessions(redis)
+bot.loop.create_task(usage.usage_flusher(redis))
 
 
-async def user_info(message):
+def redis_usage():
+    usage = {}
+    for pool, redispool in (('config', redis), ('cache', rediscache)):
+        for state, value in redispool.usage().items():
+            usage[(('pool', pool), ('state', state))] = value
+    return usage
+
+
+async def redis_ready():
+    return await redis.redis.ping() and await rediscache.redis.ping()
+
+
+async def gateway_ready():
+    return bot.is_ready() and not bot.is_closed() and bot.latency == bot.latency
+
+
+if metrics_enabled:
+    metrics.gauge('wowinfobot_redis_connections', redis_usage)
+    metrics.gauge('wowinfobot_gateway_latency_seconds', lambda: bot.latency)
+    metrics.gauge('wowinfobot_guilds', lambda: len(bot.guilds))
+    metrics.gauge('wowinfobot_item_catalog_items', lambda: len(catalog))
+    metrics.readiness('redis', redis_ready)
+    metrics.readiness('gateway', gateway_ready)
+    bot.loop.create_task(metrics.loop_lag())
+    bot.loop.create_task(metrics.start_server(metrics_host, metrics_port + int(cluster_id or 0)))
+
+
+def role_flags(role_ids, guildconfig):
+    role_ids = set(role_ids)
+    is_admin_role = _role_id(guildconfig.get("discord", "admin_role_id")) in role_ids
+    is_user_role = _role_id(guildconfig.get("discord", "user_role_id")) in role_ids
+    return is_admin_role, is_user_role
+
+
+def _role_id(role_id):
+    try:
+        return int(role_id)
+    except (TypeError, ValueError):
+        return 0
+
+
+async def user_info(ctx):
+    message = ctx.message
+    is_superadmin = str(message.author.id) == str(superadmin_id)
     if type(message.channel) == discord.channel.DMChannel:
-        for guild in bot.guilds:
-            member = discord.utils.get(guild.members, id=message.author.id)
-            if member:
-                is_admin_role = False
-                is_user_role = False
-                guildconfig = GuildConfigParser(redis, guild.id)
-                await guildconfig.read()
-                admin_id = guildconfig.get("discord", "admin_role_id")
-                user_id = guildconfig.get("discord", "user_role_id")
-                for role in member.roles:
-                    if str(role.id) == str(admin_id):
-                        is_admin_role = True
-                    if str(role.id) == str(user_id):
-                        is_user_role = True
-                if str(message.author.id) == str(superadmin_id):
-                    is_superadmin = True
-                else:
-                    is_superadmin = False
-                return {'user_id': message.author.id, 'user_name': message.author.name, 'guild_id': guild.id, 'guild_name': guild.name, 'channel': 'DMChannel', 'is_member': True, 'is_user': is_user_role, 'is_admin': is_admin_role, 'is_superadmin': is_superadmin}
-            else:
-                return {'user_id': message.author.id, 'user_name': message.author.name, 'guild_id': None, 'guild_name': None, 'channel': 'DMChannel', 'is_member': False, 'is_user': False, 'is_admin': False, 'is_superadmin': is_superadmin}
+        memberships = await memberindex.memberships(message.author.id)
+        if ctx.setup is not None and ctx.setup['guild_id'] in memberships:
+            memberships = {ctx.setup['guild_id']: memberships[ctx.setup['guild_id']]}
+        resolved = None
+        for guild_id, (guild_name, role_ids) in sorted(memberships.items()):
+            guildconfig = await ctx.guildconfig(guild_id)
+            is_admin_role, is_user_role = role_flags(role_ids, guildconfig)
+            user = {'user_id': message.author.id, 'user_name': message.author.name, 'guild_id': guild_id, 'guild_name': guild_name, 'channel': 'DMChannel', 'is_member': True, 'is_user': is_user_role, 'is_admin': is_admin_role, 'is_superadmin': is_superadmin}
+            if is_admin_role:
+                return user
+            if resolved is None or (is_user_role and not resolved['is_user']):
+                resolved = user
+        if resolved is not None:
+            return resolved
+        return {'user_id': message.author.id, 'user_name': message.author.name, 'guild_id': None, 'guild_name': None, 'channel': 'DMChannel', 'is_member': False, 'is_user': False, 'is_admin': False, 'is_superadmin': is_superadmin}
     else:
-        is_admin_role = False
-        is_user_role = False
-        guildconfig = GuildConfigParser(redis, message.author.guild.id)
-        await guildconfig.read()
-        admin_id = guildconfig.get("discord", "admin_role_id")
-        user_id = guildconfig.get("discord", "user_role_id")
-        member = discord.utils.get(message.author.guild.members, id=message.author.id)
-        for role in member.roles:
-            if str(role.id) == str(admin_id):
-                is_admin_role = True
-            if str(role.id) == str(user_id):
-                is_user_role = True
-            if str(message.author.id) == str(superadmin_id):
-                is_superadmin = True
-            else:
-                is_superadmin = False
-        return {'user_id': message.author.id, 'user_name': message.author.name, 'guild_id': message.author.guild.id, 'guild_name': message.author.guild.name, 'channel': message.channel.id, 'is_member': True, 'is_user': is_user_role, 'is_admin': is_admin_role, 'is_superadmin': is_superadmin}
+        guildconfig = await ctx.guildconfig(message.guild.id)
+        member = message.guild.get_member(message.author.id) or message.author
+        is_admin_role, is_user_role = role_flags([role.id for role in member.roles], guildconfig)
+        return {'user_id': message.author.id, 'user_name': message.author.name, 'guild_id': message.guild.id, 'guild_name': message.guild.name, 'channel': message.channel.id, 'is_member': True, 'is_user': is_user_role, 'is_admin': is_admin_role, 'is_superadmin': is_superadmin}
 
 
-def filter_details(name, tags, labels):
-    details = []
-    for line in labels:
-        label = line['label']
-        if label != 'Sell Price:' and not label.startswith('Item Level') and not label.startswith('Requires Level') and label not in tags and label != name:
-            details.append(label)
-    return details
+async def fight_data(wclclient, fid, fight=None):
+    if fight is None:
+        fight = await fillcache(rediscache, cachekey('fights', fid), projected('fights', partial(wclclient.fights, fid)), 60 * int(fights_thresh))
+    return fightsummary(fight)
 
 
-async def fight_data(wclclient, fid):
-    fight = await getcache(rediscache, f'fights-{fid}')
-    if fight is None:
-        fight = await wclclient.fights(fid)
-        await putcache(rediscache, f'fights-{fid}', fight, 60 * int(fights_thresh))
-    kills = 0
-    wipes = 0
-    size = 0
-    for key, value in fight.items():
-        if key == 'fights':
-            for each in value:
-                if 'kill' in each:
-                    if each['kill']:
-                        kills = kills + 1
-                        lastboss = each['name']
-                        size = each['size']
-                    if not each['kill']:
-                        wipes = wipes + 1
-    return kills, wipes, size, lastboss
+async def report_summary(wclclient, fid, semaphore, fight=None):
+    async with semaphore:
+        try:
+            return await asyncio.wait_for(asyncio.shield(fight_data(wclclient, fid, fight=fight)), timeout=fight_timeout)
+        except asyncio.TimeoutError:
+            log.warning(f'Timeout retrieving fight data for report [{fid}]')
+        except:
+            log.exception(f'Error retrieving fight data for report [{fid}]')
+        return None
 
 
 def logcommand(message, user):
@@ -281,16 +361,24 @@ async def bad_command(message, user, guildconfig, *args):
 
 
 async def messagesend(message, embed, user, guildconfig, respo=None):
-    try:
-        if respo is not None:
-            await respo.delete()
-        if type(message.channel) == discord.channel.DMChannel:
-            return await message.author.send(embed=embed)
-        elif guildconfig.get('discord', 'pm_only') == "True" or (guildconfig.get('discord', 'limit_to_channel') != "Any" and str(message.channel.id) != guildconfig.get('discord', 'limit_to_channel_id')):
-            await message.delete()
-            return await message.author.send(embed=embed)
+    marker = servedstale.get()
+    if marker is not None and marker['stale']:
+        footer = embed.footer.text
+        if footer:
+            embed.set_footer(text=f'{footer} | {STALE_FOOTER}')
         else:
-            return await message.channel.send(embed=embed)
+            embed.set_footer(text=STALE_FOOTER)
+    try:
+        with span('discord.send'):
+            if respo is not None:
+                await respo.delete()
+            if type(message.channel) == discord.channel.DMChannel:
+                return await message.author.send(embed=embed)
+            elif guildconfig.get('discord', 'pm_only') == "True" or (guildconfig.get('discord', 'limit_to_channel') != "Any" and str(message.channel.id) != guildconfig.get('discord', 'limit_to_channel_id')):
+                await message.delete()
+                return await message.author.send(embed=embed)
+            else:
+                return await message.channel.send(embed=embed)
     except:
         log.exception("Critical error in message send")
 
@@ -342,6 +430,9 @@ async def checkhttperrors(message, user, guildconfig, checkdata, placeholder='re
 @bot.event
 async def on_ready():
         log.log("SUCCESS", f"Discord logged in as {bot.user.name} id {bot.user.id}")
+        await memberindex.clear()
+        for guild in bot.guilds:
+            await memberindex.add_guild(guild)
         activity = discord.Activity(type=discord.ActivityType.listening, name="a PM from you")
         try:
             await bot.change_presence(status=discord.Status.online, activity=activity)
@@ -349,49 +440,96 @@ async def on_ready():
             log.error("Exiting")
 
 
+@bot.event
+async def on_guild_join(guild):
+    await memberindex.add_guild(guild)
+
+
+@bot.event
+async def on_guild_available(guild):
+    await memberindex.add_guild(guild)
+
+
+@bot.event
+async def on_guild_remove(guild):
+    await memberindex.remove_guild(guild)
+
+
+@bot.event
+async def on_guild_update(before, after):
+    await memberindex.update_guild(after)
+
+
+@bot.event
+async def on_guild_role_create(role):
+    await memberindex.update_guild(role.guild)
+
+
+@bot.event
+async def on_guild_role_delete(role):
+    await memberindex.update_guild(role.guild)
+
+
+@bot.event
+async def on_guild_role_update(before, after):
+    await memberindex.update_guild(after.guild)
+
+
+@bot.event
+async def on_guild_channel_create(channel):
+    await memberindex.update_guild(channel.guild)
+
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    await memberindex.update_guild(channel.guild)
+
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    await memberindex.update_guild(after.guild)
+
+
+@bot.event
+async def on_member_join(member):
+    await memberindex.add(member)
+
+
+@bot.event
+async def on_member_update(before, after):
+    if before.roles != after.roles:
+        await memberindex.add(after)
+
+
+@bot.event
+async def on_member_remove(member):
+    await memberindex.remove(member)
+
+
 @bot.event
 async def on_message(message):
     if message.author.id != bot.user.id:
-        user = await user_info(message)
+        track_stale()
+        ctx = MessageContext(message, redis)
+        if type(message.channel) == discord.channel.DMChannel:
+            ctx.setup = await setupsessions.get(message.author.id)
+        user = await user_info(ctx)
+        ctx.user = user
         if user['guild_id'] is None:
             pass
         else:
-            guildconfig = GuildConfigParser(redis, user['guild_id'])
-            await guildconfig.read()
-            if user['user_id'] in running_setup:
+            guildconfig = await ctx.guildconfig(user['guild_id'])
+            if ctx.setup is not None:
+                user['setup'] = ctx.setup
                 await fake_typing(message)
                 if message.content.lower() == 'cancel':
                     title = 'Setup wizard has been cancelled'
                     msg = f'Type `{guildconfig.get("discord", "command_prefix")}setup` at any time to run the setup wizard again'
                     embed = discord.Embed(title=title, description=msg, color=FAIL_COLOR)
-                    del running_setup[user['user_id']]
+                    await setupsessions.delete(user['user_id'])
                     await messagesend(message, embed, user, guildconfig)
-                elif running_setup[user['user_id']]['setupstep'] == 1:
-                    await response1(message, user, guildconfig)
-                elif running_setup[user['user_id']]['setupstep'] == 2:
-                    await response2(message, user, guildconfig)
-                elif running_setup[user['user_id']]['setupstep'] == 3:
-                    await response3(message, user, guildconfig)
-                elif running_setup[user['user_id']]['setupstep'] == 4:
-                    await response4(message, user, guildconfig)
-                elif running_setup[user['user_id']]['setupstep'] == 5:
-                    await response5(message, user, guildconfig)
-                elif running_setup[user['user_id']]['setupstep'] == 6:
-                    await response6(message, user, guildconfig)
-                elif running_setup[user['user_id']]['setupstep'] == 7:
-                    await response7(message, user, guildconfig)
-                elif running_setup[user['user_id']]['setupstep'] == 8:
-                    await response8(message, user, guildconfig)
-                elif running_setup[user['user_id']]['setupstep'] == 9:
-                    await response9(message, user, guildconfig)
-                elif running_setup[user['user_id']]['setupstep'] == 10:
-                    await response10(message, user, guildconfig)
-                elif running_setup[user['user_id']]['setupstep'] == 11:
-                    await response11(message, user, guildconfig)
-                elif running_setup[user['user_id']]['setupstep'] == 12:
-                    await response12(message, user, guildconfig)
-                elif running_setup[user['user_id']]['setupstep'] == 13:
-                    await response13(message, user, guildconfig)
+                elif ctx.setup['setupstep'] in SETUP_RESPONSES:
+                    await SETUP_RESPONSES[ctx.setup['setupstep']](message, user, guildconfig)
             elif guildconfig.get("discord", "setupran") == "False" and type(message.channel) == discord.channel.DMChannel and message.content == "setup":
                 await fake_typing(message)
                 await setup(message, user, guildconfig)
@@ -406,43 +544,19 @@ async def on_message(message):
                     if user['is_user'] or user['is_admin']:
                         await fake_typing(message)
                         args = message.content[1:].split(' ')
-                        if len(args[0]) != 1:
-                            ccmd = fuzzycmdlookup(args[0].lower())
-                        else:
-                            ccmd = args[0].lower()
-                        if ccmd in ['raids', 'lastraids', 'lastraid']:
-                            args.pop(0)
-                            await lastraids(message, user, guildconfig, *args)
-                        elif ccmd in ["news", "wownews", "warcraftnews"]:
+                        command = commandregistry.resolve(args[0])
+                        if command is not None and command.allowed(user, type(message.channel) == discord.channel.DMChannel):
                             args.pop(0)
-                            await news(message, user, guildconfig, *args)
-                        elif ccmd in ["help", "commands", "helpme"]:
-                            args.pop(0)
-                            await help(message, user, guildconfig, *args)
-                        elif ccmd == "settings" and type(message.channel) == discord.channel.DMChannel and user['is_admin']:
-                            args.pop(0)
-                            await setting(message, user, guildconfig, *args)
-                        elif ccmd in ["player", "playerinfo", "pinfo"]:
-                            args.pop(0)
-                            await playerinfo(message, user, guildconfig, *args)
-                        elif ccmd in ["gear", "playergear", "playeritems"]:
-                            args.pop(0)
-                            await playergear(message, user, guildconfig, *args)
-                        elif ccmd in ["item", "price", "itemprice", "iteminfo"]:
-                            args.pop(0)
-                            await item(message, user, guildconfig, *args)
-                        elif ccmd in ["server", "status", "serverstatus"]:
-                            args.pop(0)
-                            await status(message, user, guildconfig, *args)
-                        elif ccmd in ["admin"] and type(message.channel) == discord.channel.DMChannel and user['is_superadmin']:
-                            args.pop(0)
-                            await admin(message, user, guildconfig, *args)
-                        elif ccmd in ["setup", 'setupwizard', 'wizard'] and type(message.channel) == discord.channel.DMChannel and user['is_admin']:
-                            args.pop(0)
-                            await setup(message, user, guildconfig, *args)
-                        elif ccmd in ["test"] and user['is_admin']:
-                            args.pop(0)
-                            await test(message, user, guildconfig, *args)
+                            start = monotonic()
+                            result = 'error'
+                            usage.attribute(user['guild_id'], command.name)
+                            try:
+                                with trace(command.name, guild=user['guild_id'], args=len(args)):
+                                    await command.handler(message, user, guildconfig, *args)
+                                result = 'ok'
+                            finally:
+                                metrics.observe('wowinfobot_command_seconds', monotonic() - start, command=command.name)
+                                metrics.inc('wowinfobot_commands_total', command=command.name, result=result)
                         else:
                             await bad_command(message, user, guildconfig, *args)
                 else:
@@ -454,10 +568,9 @@ async def on_message(message):
 async def status(message, user, guildconfig, *args):
     logcommand(message, user)
     try:
-        blizcli = BlizzardAPI(guildconfig.get("blizzard", "client_id"), guildconfig.get("blizzard", "client_secret"), guildconfig.get("server", "server_region"))
+        blizcli = clientmanager.blizzard(guildconfig.get("blizzard", "client_id"), guildconfig.get("blizzard", "client_secret"), guildconfig.get("server", "server_region"))
         await blizcli.authorize()
         serverstatus = await blizcli.realm_status(guildconfig.get("server", "server_id"))
-        await blizcli.close()
         if await checkhttperrors(message, user, guildconfig, serverstatus):
             embed = discord.Embed(title=f'{guildconfig.get("server", "server_name").title()} Server Status', color=INFO_COLOR)
             embed.add_field(name='Status', value=serverstatus["status"]["name"]["en_US"])
@@ -503,7 +616,7 @@ def abrzone(zcheck):
 async def lastraids(message, user, guildconfig, *args):
     logcommand(message, user)
     try:
-        wclclient = WarcraftLogsAPI(wcl_url, guildconfig.get('warcraftlogs', 'api_key'))
+        wclclient = clientmanager.warcraftlogs(wcl_url, guildconfig.get('warcraftlogs', 'api_key'))
         tz = guildconfig.get('server', 'server_timezone')
         if len(args) == 0:
             raidzone = None
@@ -522,7 +635,11 @@ async def lastraids(message, user, guildconfig, *args):
                 args = list(args)
                 args.pop(0)
                 gnme = ' '.join(args).title()
-        enclist = await wclclient.guild(gnme, guildconfig.get('server', 'server_name'), guildconfig.get('server', 'server_region'))
+        reportskey = f"reports-{guildconfig.get('server', 'server_region')}-{guildconfig.get('server', 'server_name')}-{gnme}".lower()
+        refresh = partial(wclclient.guild, gnme, guildconfig.get('server', 'server_name'), guildconfig.get('server', 'server_region'))
+        enclist = await getcache(rediscache, reportskey, refresh=refresh, exp=60 * reports_thresh)
+        if enclist is None:
+            enclist = await fillcache(rediscache, reportskey, refresh, 60 * reports_thresh, cacheerrors=False)
         if await checkhttperrors(message, user, guildconfig, enclist, placeholder='guild', resource='warcraft logs'):
             a = 1
             nzone = 0
@@ -532,35 +649,39 @@ async def lastraids(message, user, guildconfig, *args):
             else:
                 tttitle = f"Last 5 Logged {raidzone} Raids for {gnme}"
             embed = discord.Embed(title=tttitle, color=INFO_COLOR)
-            for each in enclist:
-                if (each['zone'] == nzone or nzone == 0 or nzone != -1) and (a <= 5):
-                    kills, wipes, size, lastboss = await fight_data(wclclient, each['id'])
-                    rtstart = convert_time(each['start'], timeonly=True, tz=tz)
-                    rtstop = convert_time(each['end'], timeonly=True, tz=tz)
-                    embed.add_field(name=f"{RZONE[each['zone']]} - {convert_time(each['start'], dateonly=True, tz=tz)} ({each['title']})", value=f"{rtstart}-{rtstop} - {elapsedTime(each['start'], each['end'])}\n[Bosses Killed: ({kills}\{BZONE[each['zone']]}) with {wipes} Wipes - Last Boss: {lastboss}](https://classic.warcraftlogs.com/reports/{each['id']})", inline=False)
-                    a = a + 1
+            candidates = [each for each in enclist if each['zone'] == nzone or nzone == 0 or nzone != -1][:5]
+            semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+            refresh = {cachekey('fights', each['id']): projected('fights', partial(wclclient.fights, each['id'])) for each in candidates}
+            fights = await get_many(rediscache, list(refresh), refresh=refresh, exp=60 * int(fights_thresh))
+            summaries = await asyncio.gather(*[report_summary(wclclient, each['id'], semaphore, fight=fights.get(cachekey('fights', each['id']))) for each in candidates])
+            for each, summary in zip(candidates, summaries):
+                rtstart = convert_time(each['start'], timeonly=True, tz=tz)
+                rtstop = convert_time(each['end'], timeonly=True, tz=tz)
+                if summary is not None:
+                    kills, wipes, size, lastboss = summary
+                    fightmsg = f"Bosses Killed: ({kills}\{BZONE[each['zone']]}) with {wipes} Wipes"
+                    if lastboss is not None:
+                        fightmsg = f"{fightmsg} - Last Boss: {lastboss}"
+                else:
+                    fightmsg = "Fight summary unavailable"
+                embed.add_field(name=f"{RZONE[each['zone']]} - {convert_time(each['start'], dateonly=True, tz=tz)} ({each['title']})", value=f"{rtstart}-{rtstop} - {elapsedTime(each['start'], each['end'])}\n[{fightmsg}](https://classic.warcraftlogs.com/reports/{each['id']})", inline=False)
+                a = a + 1
             if a == 1:
                 embed = discord.Embed(description=f"No logged raids were found for {guildconfig.get('server', 'guild_name').title()} on {[guildconfig.get('server', 'server_name').title()]}", color=FAIL_COLOR)
-            await wclclient.close()
             await messagesend(message, embed, user, guildconfig)
-        else:
-            await wclclient.close()
     except:
         log.exception('Exception in lastraids function')
-        await wclclient.close()
         await messagesend(message, error_embed(message), user, guildconfig)
 
 
 async def news(message, user, guildconfig, *args):
     logcommand(message, user)
     try:
-        news = await getcache(rediscache, 'news')
+        news = await getcache(rediscache, 'news', refresh=tsmclient.news, exp=60 * int(news_thresh))
         if news is None:
-            news = await tsmclient.news()
+            news = await fillcache(rediscache, 'news', tsmclient.news, 60 * int(news_thresh), cacheerrors=False)
             if not await checkhttperrors(message, user, guildconfig, news):
                 return None
-            else:
-                await putcache(rediscache, 'news', news, 60 * int(news_thresh))
         embed = discord.Embed(title=f'World of Warcraft Classic News', color=INFO_COLOR)
         for each in news:
             embed.add_field(name=f"**{each['title']}**", value=f"{fix_news_time(each['pubDate'], guildconfig.get('server','server_timezone'))}\n[{each['content']}]({each['link']})", inline=False)
@@ -575,10 +696,9 @@ async def playerinfo(message, user, guildconfig, *args):
     try:
         if args:
             servertimezone = guildconfig.get('server', 'server_timezone')
-            wclclient = WarcraftLogsAPI(wcl_url, guildconfig.get('warcraftlogs', 'api_key'))
+            wclclient = clientmanager.warcraftlogs(wcl_url, guildconfig.get('warcraftlogs', 'api_key'))
             player = Player(guildconfig, wclclient, rediscache, parses_thresh, tables_thresh, args[0])
             pp = await player.fetch()
-            await wclclient.close()
             if await checkhttperrors(message, user, guildconfig, pp, placeholder='player', resource='warcraft logs'):
                 if player.exists:
                     embed = discord.Embed(title=f'{args[0].capitalize()} on {guildconfig.get("server", "server_name").title()}-{guildconfig.get("server", "faction").capitalize()}', color=INFO_COLOR)
@@ -623,10 +743,9 @@ async def playergear(message, user, guildconfig, *args):
     playername = args[0]
     try:
         if args:
-            wclclient = WarcraftLogsAPI(wcl_url, guildconfig.get('warcraftlogs', 'api_key'))
+            wclclient = clientmanager.warcraftlogs(wcl_url, guildconfig.get('warcraftlogs', 'api_key'))
             player = Player(guildconfig, wclclient, rediscache, parses_thresh, tables_thresh, playername)
             pp = await player.fetch()
-            await wclclient.close()
             if await checkhttperrors(message, user, guildconfig, pp, placeholder='player', resource='warcraft logs'):
                 if player.exists:
                     embed = discord.Embed(title=f"{args[0].capitalize()}'s gear from {player.geardate}", color=INFO_COLOR)
@@ -668,16 +787,21 @@ async def item(message, user, guildconfig, *args):
                 int(args[0])
             except:
                 argstring = ' '.join(args)
-                itemdata = await tsmclient.search(query=argstring, limit=1, threshold='0.8')
-                if await checkhttperrors(message, user, guildconfig, itemdata, placeholder='item', resource='database'):
-                    itemid = itemdata[0]['itemId']
-                else:
-                    return None
+                itemid = catalog.lookup(argstring)
+                if itemid is None:
+                    itemdata = await tsmclient.search(query=argstring, limit=1, threshold='0.8')
+                    if await checkhttperrors(message, user, guildconfig, itemdata, placeholder='item', resource='database'):
+                        itemid = itemdata[0]['itemId']
+                        if 'name' in itemdata[0]:
+                            catalog.add(itemid, itemdata[0]['name'])
+                    else:
+                        return None
             else:
                 itemid = int(args[0])
             item = Item(guildconfig.get("server", "server_name"), guildconfig.get("server", "faction"), itemid)
             ires = await item.fetch(tsmclient)
             if await checkhttperrors(message, user, guildconfig, ires, placeholder='item', resource='database'):
+                catalog.add(item.id, item.name)
                 embed = discord.Embed(title="", description=f'[Wowhead Link](https://classic.wowhead.com/item={item.id}) / [ClassicDB Link](https://classicdb.ch/?item={item.id})', color=INFO_COLOR)
                 embed.set_author(name=item.name, url=f"https://classic.wowhead.com/item={item.id}", icon_url=item.icon)
                 msg = ""
@@ -732,12 +856,30 @@ async def item(message, user, guildconfig, *args):
         await messagesend(message, error_embed(message), user, guildconfig)
 
 
+async def setupstep(user, step):
+    user['setup']['setupstep'] = step
+    await setupsessions.save(user['user_id'], user['setup'])
+
+
+async def setuppick(user, kind, resp):
+    pick = user['setup'][kind].get(str(int(resp)))
+    if pick is None:
+        return None
+    rguild = bot.get_guild(user['guild_id'])
+    if rguild is not None:
+        found = rguild.get_role(pick[0]) if kind == 'roles' else rguild.get_channel(pick[0])
+        return None if found is None else [found.id, found.name]
+    rguild = await memberindex.guild(user['guild_id'])
+    current = dict(rguild[kind]) if rguild is not None else {}
+    return [pick[0], current[pick[0]]] if pick[0] in current else None
+
+
 async def setup(message, user, guildconfig, *args):
     logcommand(message, user)
-    if user['user_id'] not in running_setup:
+    if user.get('setup') is None:
         log.info(f"Starting Setup for {user['user_name']} from {user['guild_name']}")
-        user['setupstep'] = 1
-        running_setup[user['user_id']] = user
+        user['setup'] = {'guild_id': user['guild_id'], 'guild_name': user['guild_name'], 'setupstep': 1}
+        await setupsessions.save(user['user_id'], user['setup'])
         if guildconfig.get("discord", "setupran") == "True":
             title = f'Setup has already been ran for server: {user["guild_name"]}\nWould you like to run it again?'
             msg = f'**1**: Yes\n**2**: No'
@@ -765,13 +907,12 @@ async def response1(message, user, guildconfig, *args):
         title = f'Setup wizard has been cancelled for server: {user["guild_name"]}'
         msg = f'Type {guildconfig.get("discord", "command_prefix")}setup in the future to run the setup wizard again'
         embed = discord.Embed(title=title, description=msg, color=FAIL_COLOR)
-        del running_setup[user['user_id']]
+        await setupsessions.delete(user['user_id'])
         await messagesend(message, embed, user, guildconfig)
 
 
 async def setup2(message, user, guildconfig, *args):
-    user['setupstep'] = 2
-    running_setup[user['user_id']] = user
+    await setupstep(user, 2)
     title = 'Select your World of Warcraft Classic server region:'
     msg = '**1**: US\n**2**: EU'
     embed = discord.Embed(title=title, description=msg, color=SUCCESS_COLOR)
@@ -795,13 +936,11 @@ async def response2(message, user, guildconfig, *args):
 
 
 async def setup3(message, user, guildconfig, *args):
-    user['setupstep'] = 3
-    running_setup[user['user_id']] = user
+    user['setup']['setupstep'] = 3
     title = 'Select your World of Warcraft Classic server:'
-    blizcli = BlizzardAPI(bliz_int_client, bliz_int_secret, guildconfig.get("server", "server_region"))
+    blizcli = clientmanager.blizzard(bliz_int_client, bliz_int_secret, guildconfig.get("server", "server_region"))
     await blizcli.authorize()
     realms = await blizcli.realm_list()
-    await blizcli.close()
     num = 1
     slist = {}
     for realm in realms['realms']:
@@ -809,8 +948,8 @@ async def setup3(message, user, guildconfig, *args):
             slist[num] = {'name': realm['name']['en_US'], 'slug': realm['slug'], 'id': realm['id']}
             num = num + 1
     msg = ''
-    user['serverlist'] = sorted(slist.items())
-    running_setup[user['user_id']] = user
+    user['setup']['serverlist'] = [[num, sval] for num, sval in sorted(slist.items())]
+    await setupsessions.save(user['user_id'], user['setup'])
     for sname, sval in sorted(slist.items()):
         msg = msg + f'**{sname}**: {sval["name"]}\n'
     embed = discord.Embed(title=title, description=msg, color=SUCCESS_COLOR)
@@ -827,8 +966,7 @@ async def response3(message, user, guildconfig, *args):
         await messagesend(message, embed, user, guildconfig)
         await setup3(message, user, guildconfig, *args)
     else:
-        setup_user = running_setup[user['user_id']]
-        slist = setup_user['serverlist']
+        slist = user['setup']['serverlist']
         if (int(resp) - 1) > len(slist) or (int(resp) - 1) < 1:
             msg = 'Invalid server selection'
             embed = discord.Embed(description=msg, color=FAIL_COLOR)
@@ -836,10 +974,9 @@ async def response3(message, user, guildconfig, *args):
             await setup3(message, user, guildconfig, *args)
         else:
             svr = slist[int(resp) - 1][1]
-            blizcli = BlizzardAPI(bliz_int_client, bliz_int_secret, guildconfig.get("server", "server_region"))
+            blizcli = clientmanager.blizzard(bliz_int_client, bliz_int_secret, guildconfig.get("server", "server_region"))
             await blizcli.authorize()
             svr_info = await blizcli.realm_info(svr['slug'])
-            await blizcli.close()
             guildconfig.set('server', 'server_name', svr_info['name']['en_US'])
             guildconfig.set('server', 'server_timezone', svr_info['timezone'])
             guildconfig.set('server', 'server_id', svr_info['id'])
@@ -854,8 +991,7 @@ async def response3(message, user, guildconfig, *args):
 
 
 async def setup4(message, user, guildconfig, *args):
-    user['setupstep'] = 4
-    running_setup[user['user_id']] = user
+    await setupstep(user, 4)
     title = 'Select your World of Warcraft Classic faction:'
     msg = '**1**: Alliance\n**2**: Horde'
     embed = discord.Embed(title=title, description=msg, color=SUCCESS_COLOR)
@@ -879,8 +1015,7 @@ async def response4(message, user, guildconfig, *args):
 
 
 async def setup5(message, user, guildconfig, *args):
-    user['setupstep'] = 5
-    running_setup[user['user_id']] = user
+    await setupstep(user, 5)
     title = "Please enter your World of Warcraft Classic Guild's name:"
     embed = discord.Embed(title=title, color=SUCCESS_COLOR)
     await messagesend(message, embed, user, guildconfig)
@@ -894,25 +1029,19 @@ async def response5(message, user, guildconfig, *args):
 
 
 async def setup6(message, user, guildconfig, *args):
-    user['setupstep'] = 6
-    running_setup[user['user_id']] = user
+    user['setup']['setupstep'] = 6
     msg = ''
     title = "Select which discord role is allowed to change bot settings (admin):"
-    rguild = None
-    for guild in bot.guilds:
-        member = discord.utils.get(guild.members, id=message.author.id)
-        if member:
-            rguild = guild
-            break
+    rguild = await memberindex.guild(user['guild_id'])
     num = 1
     roles = {}
-    for role in rguild.roles:
-        if role.name != '@everyone':
-            roles[num] = role
-            msg = msg + f'**{num}**: {role.name}\n'
+    for role_id, role_name in (rguild['roles'] if rguild is not None else ()):
+        if role_name != '@everyone':
+            roles[str(num)] = [role_id, role_name]
+            msg = msg + f'**{num}**: {role_name}\n'
             num = num + 1
-    user['roles'] = roles
-    running_setup[user['user_id']] = user
+    user['setup']['roles'] = roles
+    await setupsessions.save(user['user_id'], user['setup'])
     embed = discord.Embed(title=title, description=msg, color=SUCCESS_COLOR)
     await messagesend(message, embed, user, guildconfig)
 
@@ -927,38 +1056,32 @@ async def response6(message, user, guildconfig, *args):
         await messagesend(message, embed, user, guildconfig)
         await setup6(message, user, guildconfig, *args)
     else:
-        if int(resp) > (len(running_setup[user['user_id']]['roles'])) or int(resp) < 1:
+        srole = await setuppick(user, 'roles', resp)
+        if srole is None:
             msg = 'Invalid role selection'
             embed = discord.Embed(description=msg, color=FAIL_COLOR)
             await messagesend(message, embed, user, guildconfig)
             await setup6(message, user, guildconfig, *args)
         else:
-            srole = running_setup[user['user_id']]['roles'][int(resp)]
-            guildconfig.set('discord', 'admin_role_id', srole.id)
-            guildconfig.set('discord', 'admin_role', srole.name)
+            guildconfig.set('discord', 'admin_role_id', srole[0])
+            guildconfig.set('discord', 'admin_role', srole[1])
             await guildconfig.write()
             await setup7(message, user, guildconfig, *args)
 
 
 async def setup7(message, user, guildconfig, *args):
-    user['setupstep'] = 7
-    running_setup[user['user_id']] = user
+    user['setup']['setupstep'] = 7
     msg = ''
     title = "Select which discord role that should be allowed to use bot commands:"
-    rguild = None
-    for guild in bot.guilds:
-        member = discord.utils.get(guild.members, id=message.author.id)
-        if member:
-            rguild = guild
-            break
+    rguild = await memberindex.guild(user['guild_id'])
     num = 1
     roles = {}
-    for role in rguild.roles:
-        roles[num] = role
-        msg = msg + f'**{num}**: {role.name}\n'
+    for role_id, role_name in (rguild['roles'] if rguild is not None else ()):
+        roles[str(num)] = [role_id, role_name]
+        msg = msg + f'**{num}**: {role_name}\n'
         num = num + 1
-    user['roles'] = roles
-    running_setup[user['user_id']] = user
+    user['setup']['roles'] = roles
+    await setupsessions.save(user['user_id'], user['setup'])
     embed = discord.Embed(title=title, description=msg, color=SUCCESS_COLOR)
     await messagesend(message, embed, user, guildconfig)
 
@@ -973,22 +1096,21 @@ async def response7(message, user, guildconfig, *args):
         await messagesend(message, embed, user, guildconfig)
         await setup7(message, user, guildconfig, *args)
     else:
-        if int(resp) > (len(running_setup[user['user_id']]['roles'])) or int(resp) < 1:
+        srole = await setuppick(user, 'roles', resp)
+        if srole is None:
             msg = 'Invalid role selection'
             embed = discord.Embed(description=msg, color=FAIL_COLOR)
             await messagesend(message, embed, user, guildconfig)
             await setup7(message, user, guildconfig, *args)
         else:
-            srole = running_setup[user['user_id']]['roles'][int(resp)]
-            guildconfig.set('discord', 'user_role_id', srole.id)
-            guildconfig.set('discord', 'user_role', srole.name)
+            guildconfig.set('discord', 'user_role_id', srole[0])
+            guildconfig.set('discord', 'user_role', srole[1])
             await guildconfig.write()
             await setup8(message, user, guildconfig, *args)
 
 
 async def setup8(message, user, guildconfig, *args):
-    user['setupstep'] = 8
-    running_setup[user['user_id']] = user
+    await setupstep(user, 8)
     title = 'Select where the bot should respond:'
     msg = '**1**: Private Message Only (No Channels)\n**2**: Private Message & 1 Specific Channel Only\n**3**: Private Message & Any Channel'
     embed = discord.Embed(title=title, description=msg, color=SUCCESS_COLOR)
@@ -1020,20 +1142,18 @@ async def response8(message, user, guildconfig, *args):
 
 
 async def setup9(message, user, guildconfig, *args):
-    user['setupstep'] = 9
-    running_setup[user['user_id']] = user
+    user['setup']['setupstep'] = 9
     msg = ''
     num = 1
     channels = {}
     title = 'Select which channel to limit the bot to:'
-    for guild in bot.guilds:
-        member = discord.utils.get(guild.members, id=message.author.id)
-        if member:
-            for channel in guild.text_channels:
-                channels[num] = channel
-                msg = msg + f'**{num}**: {channel}\n'
-                num = num + 1
-    user['channels'] = channels
+    rguild = await memberindex.guild(user['guild_id'])
+    for channel_id, channel_name in (rguild['channels'] if rguild is not None else ()):
+        channels[str(num)] = [channel_id, channel_name]
+        msg = msg + f'**{num}**: {channel_name}\n'
+        num = num + 1
+    user['setup']['channels'] = channels
+    await setupsessions.save(user['user_id'], user['setup'])
     embed = discord.Embed(title=title, description=msg, color=SUCCESS_COLOR)
     await messagesend(message, embed, user, guildconfig)
 
@@ -1048,22 +1168,21 @@ async def response9(message, user, guildconfig, *args):
         await messagesend(message, embed, user, guildconfig)
         await setup9(message, user, guildconfig, *args)
     else:
-        if int(resp) > (len(running_setup[user['user_id']]['channels'])) or int(resp) < 1:
+        chan = await setuppick(user, 'channels', resp)
+        if chan is None:
             msg = 'Invalid channel selection'
             embed = discord.Embed(description=msg, color=FAIL_COLOR)
             await messagesend(message, embed, user, guildconfig)
             await setup9(message, user, guildconfig, *args)
         else:
-            chan = running_setup[user['user_id']]['channels'][int(resp)]
-            guildconfig.set('discord', 'limit_to_channel_id', chan.id)
-            guildconfig.set('discord', 'limit_to_channel', chan.name)
+            guildconfig.set('discord', 'limit_to_channel_id', chan[0])
+            guildconfig.set('discord', 'limit_to_channel', chan[1])
             await guildconfig.write()
             await setup10(message, user, guildconfig, *args)
 
 
 async def setup10(message, user, guildconfig, *args):
-    user['setupstep'] = 10
-    running_setup[user['user_id']] = user
+    await setupstep(user, 10)
     title = 'Paste your Warcraft Logs API Key:'
     msg = ''
     if guildconfig.get("warcraftlogs", "api_key") != "None":
@@ -1089,8 +1208,7 @@ async def response10(message, user, guildconfig, *args):
 
 
 async def setup11(message, user, guildconfig, *args):
-    user['setupstep'] = 11
-    running_setup[user['user_id']] = user
+    await setupstep(user, 11)
     title = 'Paste your Blizzard API Client ID:'
     msg = ''
     if guildconfig.get("blizzard", "client_id") != "None":
@@ -1116,8 +1234,7 @@ async def response11(message, user, guildconfig, *args):
 
 
 async def setup12(message, user, guildconfig, *args):
-    user['setupstep'] = 12
-    running_setup[user['user_id']] = user
+    await setupstep(user, 12)
     title = 'Paste your Blizzard API Client SECRET:'
     msg = ''
     if guildconfig.get("blizzard", "client_secret") != "None":
@@ -1143,8 +1260,7 @@ async def response12(message, user, guildconfig, *args):
 
 
 async def setup13(message, user, guildconfig, *args):
-    user['setupstep'] = 13
-    running_setup[user['user_id']] = user
+    await setupstep(user, 13)
     title = "Select a command prefix for bot commands:"
     embed = discord.Embed(title=title, color=SUCCESS_COLOR)
     for num, cmd in COMMAND_PREFIXES.items():
@@ -1170,7 +1286,7 @@ async def response13(message, user, guildconfig, *args):
         else:
             guildconfig.set('discord', 'command_prefix', COMMAND_PREFIXES[int(resp)][0])
             await guildconfig.write()
-            del running_setup[user['user_id']]
+            await setupsessions.delete(user['user_id'])
             guildconfig.set("discord", "setupran", "True")
             guildconfig.set("discord", "setupadmin", user['user_name'])
             guildconfig.set("discord", "setupadmin_id", user['user_id'])
@@ -1210,6 +1326,8 @@ async def admin(message, user, guildconfig, *args):
                 msg = f"ServerID: **{eguild.id}**\nRealm: **{guildconfig.get('server', 'server_category')}**\nGuild: **{guildconfig.get('server', 'guild_name')}**\nFaction: **{guildconfig.get('server', 'faction')}**\nTimezone: **{guildconfig.get('server', 'server_timezone')}**\nShardID: **{eguild.shard_id}**\nChunked: **{eguild.chunked}**\nClients: **{eguild.member_count}**\nSetup Ran? **{guildconfig.get('discord','setupran')}**\nSetup Admin: **{guildconfig.get('discord', 'setupadmin')}**\n\n"
                 embed.add_field(name=f"{eguild.name}", value=msg)
             await message.author.send(embed=embed)
+        if args[0] == 'usage':
+            await admin_usage(message, user, guildconfig, *args[1:])
         if args[0] == 'invite':
             msg = 'https://discord.com/oauth2/authorize?bot_id=750867600250241086&scope=bot&permissions=8'
             embed = discord.Embed(description=msg, color=SUCCESS_COLOR)
@@ -1220,6 +1338,35 @@ async def admin(message, user, guildconfig, *args):
         await messagesend(message, embed, user, guildconfig)
 
 
+async def admin_usage(message, user, guildconfig, *args):
+    hours = 24
+    if args and args[0].isdigit():
+        hours = max(1, min(int(args[0]), usage.RETENTION // usage.BUCKET))
+    await usage.flush(redis)
+    totals = await usage.report(redis, hours)
+    requests = totals['upstream'] + totals['hits']
+    saved = f"{truncate_float(100 * totals['hits'] / requests, 1)}%" if requests else 'n/a'
+    embed = discord.Embed(title=f"Upstream Usage (last {hours}h)", description=f"Upstream calls: **{totals['upstream']}**\nCache hits: **{totals['hits']}** ({saved} of requests served from cache)", color=SUCCESS_COLOR)
+    msg = ''
+    for guild_id, count in totals['guild'].most_common(10):
+        rguild = await memberindex.guild(int(guild_id)) if guild_id.isdigit() else None
+        msg = msg + f"**{rguild['name'] if rguild is not None else guild_id}**: {count}\n"
+    embed.add_field(name="Top Guilds", value=msg or 'None', inline=False)
+    msg = ''
+    for command, count in totals['command'].most_common(10):
+        msg = msg + f"**{command}**: {count}\n"
+    embed.add_field(name="Top Commands", value=msg or 'None', inline=False)
+    msg = ''
+    for apikey, count in totals['key'].most_common(10):
+        msg = msg + f"**{apikey}**: {count}\n"
+    embed.add_field(name="Top API Keys", value=msg or 'None', inline=False)
+    msg = ''
+    for family, count in totals['saved'].most_common():
+        msg = msg + f"**{family}**: {count}\n"
+    embed.add_field(name="Cache Savings", value=msg or 'None', inline=False)
+    await message.author.send(embed=embed)
+
+
 async def help(message, user, guildconfig, *args):
     logcommand(message, user)
     command_prefix = guildconfig.get("discord", "command_prefix")
@@ -1247,12 +1394,18 @@ async def help(message, user, guildconfig, *args):
     await message.author.send(embed=embed)
 
 
-async def test(message, user, guildconfig, *args):
-    logcommand(message, user)
-    # blizcli = BlizzardAPI(bliz_int_client, bliz_int_secret, guildconfig.get("server", "server_region"))
-    # await blizcli.authorize()
-    # pprint(await blizcli.realm_list())
-    pprint(guildconfig._sections)
+SETUP_RESPONSES = {1: response1, 2: response2, 3: response3, 4: response4, 5: response5, 6: response6, 7: response7, 8: response8, 9: response9, 10: response10, 11: response11, 12: response12, 13: response13}
+
+commandregistry.register(lastraids, COMMAND_ALIASES['lastraids'])
+commandregistry.register(news, COMMAND_ALIASES['news'])
+commandregistry.register(help, COMMAND_ALIASES['help'])
+commandregistry.register(setting, COMMAND_ALIASES['setting'], dm_only=True, permission='is_admin')
+commandregistry.register(playerinfo, COMMAND_ALIASES['playerinfo'])
+commandregistry.register(playergear, COMMAND_ALIASES['playergear'])
+commandregistry.register(item, COMMAND_ALIASES['item'])
+commandregistry.register(status, COMMAND_ALIASES['status'])
+commandregistry.register(admin, COMMAND_ALIASES['admin'], dm_only=True, permission='is_superadmin')
+commandregistry.register(setup, COMMAND_ALIASES['setup'], dm_only=True, permission='is_admin')
 
 
 def main():
@@ -1,16 +1,315 @@
+from asyncio import CancelledError, ensure_future, shield, sleep
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from time import monotonic, time
+from uuid import uuid4
+
 from loguru import logger as log
 import msgpack
+from circuitbreaker import UNAVAILABLE
+import metrics
+from tracing import current, span
+import usage
+from ratelimit import BACKGROUND, priority
+
+LOCK_TIMEOUT = 10
+LOCK_POLL = 0.1
+STALE_WINDOW = 3600
+
+SOFT_FIELD = '_soft'
+VALUE_FIELD = '_value'
+
+RELEASE_LOCK = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+INVALIDATE_CHANNEL = 'cache-invalidate'
+INSTANCE_ID = uuid4().hex
+
+inflight = {}
+waiters = Counter()
+cachestats = Counter()
+servedstale = ContextVar('servedstale', default=None)
+
+
+def iserror(value):
+    if isinstance(value, list) and len(value) > 0:
+        value = value[0]
+    return isinstance(value, dict) and 'error' in value
+
+
+def isunavailable(value):
+    if isinstance(value, list) and len(value) > 0:
+        value = value[0]
+    return isinstance(value, dict) and value.get('error') == UNAVAILABLE
+
+
+def _count(key, result):
+    cachestats[result] += 1
+    if result == 'l1_hit' or result == 'redis_hit':
+        usage.record(usage.SAVED, metrics.keyfamily(key))
+    metrics.inc('wowinfobot_cache_requests_total', family=metrics.keyfamily(key), result=result)
+
+
+def track_stale():
+    marker = {'stale': False}
+    servedstale.set(marker)
+    return marker
+
+
+# Hits return the cached object itself, so callers must treat cached values as read-only
+class LocalCache:
+
+    def __init__(self, maxsize=1024, maxttl=60):
+        self.maxsize = maxsize
+        self.maxttl = maxttl
+        self.entries = OrderedDict()
+        self.frequency = Counter()
+        self.ops = 0
+
+    def get(self, key):
+        self._touch(key)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, ttl):
+        ttl = min(ttl, self.maxttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            self.entries.pop(key, None)
+            return None
+        if key not in self.entries and len(self.entries) >= self.maxsize:
+            victim = next(iter(self.entries))
+            if self.frequency[key] < self.frequency[victim]:
+                return None
+            del self.entries[victim]
+        self.entries[key] = (value, monotonic() + ttl)
+        self.entries.move_to_end(key)
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    def _touch(self, key):
+        self.frequency[key] += 1
+        self.ops += 1
+        if self.ops >= self.maxsize * 10:
+            self.ops = 0
+            self.frequency = Counter({fkey: count // 2 for fkey, count in self.frequency.items() if count > 1})
+
+
+localcache = LocalCache()
+
+
+def setup_cache(local_size, local_ttl, stale_window):
+    global localcache, STALE_WINDOW
+    localcache = LocalCache(maxsize=local_size, maxttl=local_ttl)
+    STALE_WINDOW = stale_window
+
 
+def _pack(value, exp):
+    return msgpack.packb({SOFT_FIELD: time() + exp, VALUE_FIELD: value})
 
-async def getcache(redis, key):
-    if await redis.redis.exists(key):
+
+def _unpack(raw):
+    with span('msgpack.unpack', size=len(raw)):
+        entry = msgpack.unpackb(raw)
+    if isinstance(entry, dict) and SOFT_FIELD in entry and VALUE_FIELD in entry:
+        return entry[VALUE_FIELD], entry[SOFT_FIELD]
+    return entry, float('inf')
+
+
+def _revalidate(redis, key, soft, refresh, exp):
+    if soft <= time():
+        marker = servedstale.get()
+        if marker is not None:
+            marker['stale'] = True
+    if refresh is None or soft > time() or key in inflight:
+        return None
+    log.trace(f'Cache STALE! for [{key}] scheduling background refresh')
+    _count(key, 'stale')
+    ensure_future(_refresh(redis, key, refresh, exp))
+
+
+async def _refresh(redis, key, fetcher, exp):
+    priority.set(BACKGROUND)
+    current.set(None)
+    try:
+        await fillcache(redis, key, fetcher, exp, cacheerrors=False)
+    except:
+        log.exception(f'Error refreshing stale cache entry [{key}]')
+
+
+async def getcache(redis, key, refresh=None, exp=None):
+    entry = localcache.get(key)
+    if entry is not None:
+        _count(key, 'l1_hit')
+        log.trace(f'Local cache HIT! for [{key}]')
+        _revalidate(redis, key, entry[1], refresh, exp)
+        return entry[0]
+    _count(key, 'l1_miss')
+    pipe = await redis.redis.pipeline(transaction=False)
+    await pipe.get(key)
+    await pipe.pttl(key)
+    with span('redis.get', key=key):
+        raw, ttl = await pipe.execute()
+    if raw is not None:
+        _count(key, 'redis_hit')
         log.trace(f'Cache HIT! for [{key}]')
-        return msgpack.unpackb(await redis.redis.get(key))
+        value, soft = _unpack(raw)
+        localcache.put(key, (value, soft), ttl / 1000)
+        _revalidate(redis, key, soft, refresh, exp)
+        return value
     else:
+        _count(key, 'redis_miss')
         log.trace(f'Cache MISS! for [{key}]')
         return None
 
 
-async def putcache(redis, key, value, exp):
-    log.trace(f'Populating cache for [{key}] expires [{exp}]')
-    await redis.redis.set(key, msgpack.packb(value), ex=exp)
+async def putcache(redis, key, value, exp, hard=None):
+    if hard is None:
+        hard = exp + STALE_WINDOW
+    log.trace(f'Populating cache for [{key}] expires [{exp}] hard expires [{hard}]')
+    pipe = await redis.redis.pipeline(transaction=False)
+    await pipe.set(key, _pack(value, exp), ex=hard)
+    await pipe.publish(INVALIDATE_CHANNEL, f'{INSTANCE_ID}:{key}')
+    with span('redis.put', key=key):
+        await pipe.execute()
+    localcache.put(key, (value, time() + exp), hard)
+
+
+async def get_many(redis, keys, refresh=None, exp=None):
+    if refresh is None:
+        refresh = {}
+    results = {}
+    remote = []
+    for key in keys:
+        entry = localcache.get(key)
+        if entry is not None:
+            _count(key, 'l1_hit')
+            log.trace(f'Local cache HIT! for [{key}]')
+            results[key] = entry[0]
+            _revalidate(redis, key, entry[1], refresh.get(key), exp)
+        else:
+            _count(key, 'l1_miss')
+            remote.append(key)
+    if len(remote) == 0:
+        return results
+    pipe = await redis.redis.pipeline(transaction=False)
+    for key in remote:
+        await pipe.get(key)
+        await pipe.pttl(key)
+    with span('redis.get_many', keys=len(remote)):
+        values = await pipe.execute()
+    for num, key in enumerate(remote):
+        raw, ttl = values[num * 2], values[num * 2 + 1]
+        if raw is not None:
+            _count(key, 'redis_hit')
+            log.trace(f'Cache HIT! for [{key}]')
+            value, soft = _unpack(raw)
+            results[key] = value
+            localcache.put(key, (value, soft), ttl / 1000)
+            _revalidate(redis, key, soft, refresh.get(key), exp)
+        else:
+            _count(key, 'redis_miss')
+            log.trace(f'Cache MISS! for [{key}]')
+    return results
+
+
+async def listen(redis, channel, handler, reset=None):
+    while True:
+        try:
+            pubsub = redis.redis.pubsub()
+            await pubsub.subscribe(channel)
+            log.debug(f'Invalidation listener subscribed to [{channel}]')
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
+                if message is not None and message['type'] == 'message':
+                    instance, key = message['data'].decode().split(':', 1)
+                    if instance != INSTANCE_ID:
+                        handler(key)
+        except CancelledError:
+            raise
+        except:
+            log.exception(f'Invalidation listener error on [{channel}], resubscribing...')
+            if reset is not None:
+                reset()
+            await sleep(5)
+
+
+def _invalidate(key):
+    log.trace(f'Local cache invalidated for [{key}]')
+    localcache.invalidate(key)
+
+
+async def invalidation_listener(redis):
+    await listen(redis, INVALIDATE_CHANNEL, _invalidate, reset=lambda: localcache.entries.clear())
+
+
+async def fillcache(redis, key, fetcher, exp, cacheerrors=True):
+    task = None
+    waiters[key] += 1
+    try:
+        with span('cache.fill', key=key) as fill:
+            task = inflight.get(key)
+            if task is None:
+                task = ensure_future(_fillcache(redis, key, fetcher, exp, cacheerrors))
+                inflight[key] = task
+                task.add_done_callback(lambda t: _forget(key, t))
+            else:
+                log.trace(f'Cache fill coalesced for [{key}]')
+                fill.set(coalesced=True)
+            return await shield(task)
+    except CancelledError:
+        if waiters[key] == 1 and task is not None and not task.done():
+            log.trace(f'Cache fill for [{key}] cancelled, no waiters left')
+            _forget(key, task)
+            task.cancel()
+        raise
+    finally:
+        waiters[key] -= 1
+        if waiters[key] <= 0:
+            del waiters[key]
+
+
+def _forget(key, task):
+    if inflight.get(key) is task:
+        del inflight[key]
+
+
+async def _peek(redis, key):
+    raw = await redis.redis.get(key)
+    if raw is None:
+        return None
+    value, soft = _unpack(raw)
+    if soft <= time():
+        return None
+    return value
+
+
+async def _fillcache(redis, key, fetcher, exp, cacheerrors):
+    lockkey = f'lock-{key}'
+    token = uuid4().hex
+    if not await redis.redis.set(lockkey, token, px=LOCK_TIMEOUT * 1000, nx=True):
+        log.trace(f'Cache fill for [{key}] locked by another instance, waiting')
+        waited = 0
+        while waited < LOCK_TIMEOUT:
+            await sleep(LOCK_POLL)
+            waited = waited + LOCK_POLL
+            value = await _peek(redis, key)
+            if value is not None:
+                return value
+            if not await redis.redis.exists(lockkey):
+                break
+        if not await redis.redis.set(lockkey, token, px=LOCK_TIMEOUT * 1000, nx=True):
+            token = None
+    try:
+        value = await fetcher()
+        if (cacheerrors and not isunavailable(value)) or not iserror(value):
+            await putcache(redis, key, value, exp)
+        return value
+    finally:
+        if token is not None:
+            await redis.redis.eval(RELEASE_LOCK, 1, lockkey, token)
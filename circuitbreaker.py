@@ -0,0 +1,87 @@
+from collections import deque
+from time import monotonic
+
+from loguru import logger as log
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+UNAVAILABLE = 'unavailable'
+
+breakers = {}
+settings = {'window': 60, 'minimum': 10, 'threshold': 0.5, 'cooldown': 30}
+
+
+class CircuitBreaker:
+
+    def __init__(self, name, window=60, minimum=10, threshold=0.5, cooldown=30):
+        self.name = name
+        self.window = window
+        self.minimum = minimum
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.results = deque()
+        self.failures = 0
+        self.opened = 0
+        self.probing = False
+
+    def allow(self):
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if monotonic() - self.opened < self.cooldown:
+                return False
+            self.state = HALF_OPEN
+            self.probing = False
+            log.info(f'Circuit [{self.name}] half-open, probing upstream')
+        if self.probing:
+            return False
+        self.probing = True
+        return True
+
+    def record(self, success):
+        if self.state != CLOSED:
+            if self.state == HALF_OPEN and self.probing:
+                self.probing = False
+                if success:
+                    self._close()
+                else:
+                    self._open()
+            return None
+        now = monotonic()
+        self.results.append((now, success))
+        if not success:
+            self.failures = self.failures + 1
+        while self.results and self.results[0][0] < now - self.window:
+            if not self.results.popleft()[1]:
+                self.failures = self.failures - 1
+        if self.state == CLOSED and len(self.results) >= self.minimum and self.failures / len(self.results) >= self.threshold:
+            self._open()
+
+    def release(self):
+        if self.state == HALF_OPEN:
+            self.probing = False
+
+    def _open(self):
+        self.state = OPEN
+        self.opened = monotonic()
+        log.warning(f'Circuit [{self.name}] OPEN after [{self.failures}/{len(self.results)}] failures, serving cache only for [{self.cooldown}s]')
+
+    def _close(self):
+        self.state = CLOSED
+        self.results.clear()
+        self.failures = 0
+        log.info(f'Circuit [{self.name}] closed, upstream recovered')
+
+
+def setup_breakers(window, minimum, threshold, cooldown):
+    settings.update(window=window, minimum=minimum, threshold=threshold, cooldown=cooldown)
+    breakers.clear()
+
+
+def circuit(name):
+    if name not in breakers:
+        breakers[name] = CircuitBreaker(name, **settings)
+    return breakers[name]
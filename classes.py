@@ -1,11 +1,15 @@
-from asyncio import sleep
+from asyncio import Semaphore, ensure_future, gather, sleep
+from functools import partial
 
 import aredis
+import msgpack
 from aredis.connection import UnixDomainSocketConnection
 
 from loguru import logger as log
-from cachemanager import getcache, putcache
-from constants import BOSSREF, ROLES, RZONE, SPECROLES
+from cachemanager import fillcache, get_many
+from constants import BOSSREF, FETCH_CONCURRENCY, ROLES, RZONE, SPECROLES
+from guildconfigparser import GuildConfigParser
+from projections import cachekey, projected
 from timefunctions import convert_time
 
 
@@ -45,12 +49,179 @@ class RedisPool:
                     else:
                         log.debug(f"{self.connection.capitalize()} connection verified to Redis server [{self.host}:{self.port} DB:{self.db}]")
 
+    def usage(self):
+        return {'created': self.pool._created_connections, 'available': len(self.pool._available_connections), 'in_use': len(self.pool._in_use_connections), 'max': self.pool.max_connections}
+
     async def disconnect(self):
         self.verified = False
         if self.pool is not None:
             self.pool.disconnect()
 
 
+class MemberIndex:
+
+    def __init__(self):
+        self.members = {}
+        self.guildinfo = {}
+
+    async def clear(self):
+        self.members = {}
+        self.guildinfo = {}
+
+    async def add(self, member):
+        self._put(member)
+
+    async def remove(self, member):
+        self._discard(member.id, member.guild.id)
+
+    async def update_guild(self, guild):
+        self.guildinfo[guild.id] = {'name': guild.name, 'roles': [[role.id, role.name] for role in guild.roles], 'channels': [[channel.id, channel.name] for channel in guild.text_channels]}
+
+    async def add_guild(self, guild):
+        await self.update_guild(guild)
+        for member in guild.members:
+            self._put(member)
+        log.debug(f'Member index added [{guild.member_count}] members from guild [{guild.id}]')
+
+    async def remove_guild(self, guild):
+        self.guildinfo.pop(guild.id, None)
+        for user_id in list(self.members):
+            self._discard(user_id, guild.id)
+
+    async def memberships(self, user_id):
+        memberships = {}
+        for guild_id, role_ids in self.members.get(user_id, {}).items():
+            if guild_id in self.guildinfo:
+                memberships[guild_id] = (self.guildinfo[guild_id]['name'], role_ids)
+        return memberships
+
+    async def guild(self, guild_id):
+        return self.guildinfo.get(guild_id)
+
+    def _put(self, member):
+        self.members.setdefault(member.id, {})[member.guild.id] = [role.id for role in member.roles]
+
+    def _discard(self, user_id, guild_id):
+        if user_id in self.members:
+            self.members[user_id].pop(guild_id, None)
+            if len(self.members[user_id]) == 0:
+                del self.members[user_id]
+
+
+class SharedMemberIndex(MemberIndex):
+
+    def __init__(self, redis, batch=500):
+        super().__init__()
+        self.redis = redis
+        self.batch = batch
+
+    async def add(self, member):
+        await super().add(member)
+        pipe = await self.redis.redis.pipeline(transaction=False)
+        await pipe.hset(f'member-{member.id}', member.guild.id, self._record(member))
+        await pipe.sadd(f'guildmembers-{member.guild.id}', member.id)
+        await pipe.execute()
+
+    async def remove(self, member):
+        await super().remove(member)
+        pipe = await self.redis.redis.pipeline(transaction=False)
+        await pipe.hdel(f'member-{member.id}', member.guild.id)
+        await pipe.srem(f'guildmembers-{member.guild.id}', member.id)
+        await pipe.execute()
+
+    async def update_guild(self, guild):
+        await super().update_guild(guild)
+        await self.redis.redis.set(f'guild-{guild.id}', msgpack.packb(self.guildinfo[guild.id]))
+
+    async def add_guild(self, guild):
+        await super().add_guild(guild)
+        members = list(guild.members)
+        stale = await self._members(guild.id) - {member.id for member in members}
+        await self._discard_all(guild.id, list(stale))
+        for start in range(0, len(members), self.batch):
+            pipe = await self.redis.redis.pipeline(transaction=False)
+            for member in members[start:start + self.batch]:
+                await pipe.hset(f'member-{member.id}', guild.id, self._record(member))
+                await pipe.sadd(f'guildmembers-{guild.id}', member.id)
+            await pipe.execute()
+        if len(stale) > 0:
+            log.debug(f'Member index removed [{len(stale)}] departed members from guild [{guild.id}]')
+
+    async def remove_guild(self, guild):
+        user_ids = await self._members(guild.id)
+        await super().remove_guild(guild)
+        await self._discard_all(guild.id, list(user_ids))
+        await self.redis.redis.delete(f'guild-{guild.id}', f'guildmembers-{guild.id}')
+
+    async def memberships(self, user_id):
+        memberships = {}
+        records = await self.redis.redis.hgetall(f'member-{user_id}')
+        for guild_id, record in records.items():
+            guild = await self.guild(int(guild_id))
+            if guild is not None:
+                memberships[int(guild_id)] = (guild['name'], msgpack.unpackb(record))
+        return memberships
+
+    async def guild(self, guild_id):
+        if guild_id in self.guildinfo:
+            return self.guildinfo[guild_id]
+        record = await self.redis.redis.get(f'guild-{guild_id}')
+        if record is None:
+            return None
+        return msgpack.unpackb(record)
+
+    async def _members(self, guild_id):
+        return {int(user_id) for user_id in await self.redis.redis.smembers(f'guildmembers-{guild_id}')}
+
+    async def _discard_all(self, guild_id, user_ids):
+        for start in range(0, len(user_ids), self.batch):
+            pipe = await self.redis.redis.pipeline(transaction=False)
+            for user_id in user_ids[start:start + self.batch]:
+                await pipe.hdel(f'member-{user_id}', guild_id)
+                await pipe.srem(f'guildmembers-{guild_id}', user_id)
+            await pipe.execute()
+
+    @staticmethod
+    def _record(member):
+        return msgpack.packb([role.id for role in member.roles])
+
+
+class SetupSessions:
+
+    def __init__(self, redis, expire=1800):
+        self.redis = redis
+        self.expire = expire
+
+    async def get(self, user_id):
+        session = await self.redis.redis.get(f'setup-{user_id}')
+        if session is None:
+            return None
+        return msgpack.unpackb(session)
+
+    async def save(self, user_id, session):
+        await self.redis.redis.set(f'setup-{user_id}', msgpack.packb(session), ex=self.expire)
+
+    async def delete(self, user_id):
+        await self.redis.redis.delete(f'setup-{user_id}')
+
+
+class MessageContext:
+
+    def __init__(self, message, redis):
+        self.message = message
+        self.redis = redis
+        self.user = None
+        self.setup = None
+        self.guildconfigs = {}
+
+    async def guildconfig(self, guild_id):
+        if guild_id not in self.guildconfigs:
+            guildconfig = GuildConfigParser(self.redis, guild_id)
+            await guildconfig.read()
+            self.guildconfigs[guild_id] = guildconfig
+        return self.guildconfigs[guild_id]
+
+
 class Item:
 
     def __init__(self, server, faction, itemid):
@@ -128,7 +299,7 @@ class Player:
                     if len(self.edl) > 5:
                         del self.edl[min(self.edl)]
 
-    def __init__(self, gconfig, aclient, rediscache, parseexp, tableexp, playername):
+    def __init__(self, gconfig, aclient, rediscache, parseexp, tableexp, playername, concurrency=FETCH_CONCURRENCY):
         self.playername = playername.capitalize()
         self.exists = False
         self.parseexp = int(parseexp)
@@ -154,13 +325,33 @@ class Player:
         self.client = aclient
         self.guildconfig = gconfig
         self.timezone = gconfig.get("server", "server_timezone")
+        self.semaphore = Semaphore(concurrency)
+
+    async def zone_parses(self, zone):
+        async with self.semaphore:
+            return await self.client.parses(self.playername, self.guildconfig.get("server", "server_name").title(), self.guildconfig.get("server", "server_region").upper(), zone=zone)
+
+    async def report_table(self, reportid):
+        async with self.semaphore:
+            return await self.client.tables('casts', reportid, start=0, end=18000)
+
+    def resolved(self, remaining):
+        if self.playerclass == "Not Available" or self.playerspec == "Not Available" or self.gearlevel == 0 or len(self.gearlist) < 1:
+            return False
+        for encounter in remaining:
+            if BOSSREF.get(encounter['encounterName']) == 1005:
+                return False
+        return True
 
     async def fetch(self):
-        for kkey, vval in RZONE.items():
-            parselist = await getcache(self.rediscache, f'{self.playername}-{self.guildconfig.get("server", "server_id")}-{kkey}')
-            if parselist is None:
-                parselist = await self.client.parses(self.playername, self.guildconfig.get("server", "server_name").title(), self.guildconfig.get("server", "server_region").upper(), zone=kkey)
-                await putcache(self.rediscache, f'{self.playername}-{self.guildconfig.get("server", "server_id")}-{kkey}', parselist, 60 * self.parseexp)
+        zonekeys = {zone: f'{self.playername}-{self.guildconfig.get("server", "server_id")}-{zone}' for zone in RZONE}
+        refresh = {zonekeys[zone]: partial(self.zone_parses, zone) for zone in RZONE}
+        zoneparses = await get_many(self.rediscache, list(refresh), refresh=refresh, exp=60 * self.parseexp)
+        missing = [zone for zone in RZONE if zonekeys[zone] not in zoneparses]
+        fetched = await gather(*[fillcache(self.rediscache, zonekeys[zone], refresh[zonekeys[zone]], 60 * self.parseexp) for zone in missing])
+        zoneparses.update(zip([zonekeys[zone] for zone in missing], fetched))
+        for kkey, zonekey in zonekeys.items():
+            parselist = zoneparses[zonekey]
             if len(parselist) > 0:
                 if 'error' in parselist[0]:
                     self.exists = False
@@ -182,41 +373,51 @@ class Player:
         if self.totalencounters > 0:
             self.exists = True
             self.lastencounters = sorted(self.edl.items())
-            for encounter in self.lastencounters:
-                if encounter[1] != 0:
-                    if 'class' in encounter[1] and self.playerclass == "Not Available":
-                        self.playerclass = encounter[1]['class']
-                    if 'spec' in encounter[1] and self.playerspec == "Not Available":
-                        if encounter[1]['spec'] not in ROLES:
-                            self.playerspec = encounter[1]['spec']
+            encounters = [encounter[1] for encounter in self.lastencounters if encounter[1] != 0]
+            reportids = list(dict.fromkeys([encounter['reportID'] for encounter in encounters]))
+            tablekeys = {reportid: cachekey('tables', reportid) for reportid in reportids}
+            refresh = {tablekeys[reportid]: projected('tables', partial(self.report_table, reportid)) for reportid in reportids}
+            cachedtables = await get_many(self.rediscache, list(refresh), refresh=refresh, exp=60 * self.tableexp)
+            reporttables = {reportid: ensure_future(fillcache(self.rediscache, tablekeys[reportid], refresh[tablekeys[reportid]], 60 * self.tableexp)) for reportid in reportids if tablekeys[reportid] not in cachedtables}
+            try:
+                for num, encounter in enumerate(encounters):
+                    if 'class' in encounter and self.playerclass == "Not Available":
+                        self.playerclass = encounter['class']
+                    if 'spec' in encounter and self.playerspec == "Not Available":
+                        if encounter['spec'] not in ROLES:
+                            self.playerspec = encounter['spec']
                         else:
-                            self.playerrole = encounter[1]['spec']
-
-                    reporttable = await getcache(self.rediscache, f'tables-{encounter[1]["reportID"]}')
-                    if reporttable is None:
-                        reporttable = await self.client.tables('casts', encounter[1]['reportID'], start=0, end=18000)
-                        await putcache(self.rediscache, f'tables-{encounter[1]["reportID"]}', reporttable, 60 * self.tableexp)
-
-                    for entry in reporttable['entries']:
-                        if entry['name'] == self.playername:
-                            if 'spec' in entry and self.playerspec == "Not Available":
-                                self.playerspec = entry['spec']
-                            if 'icon' in entry and self.playerspec == "Not Available" and len(entry['icon'].split('-')) == 2:
-                                self.playerclass = entry['icon'].split('-')[0]
-                                self.playerspec = entry['icon'].split('-')[1]
-                            if 'class' in entry and self.playerclass == "Not Available":
-                                self.playerclass = entry['class']
-                            if 'itemLevel' in entry and self.gearlevel == 0:
-                                self.gearlevel = entry['itemLevel']
-                            if 'gear' in entry:
-                                if len(entry['gear']) > 1:
-                                    zone = BOSSREF[encounter[1]['encounterName']]
-                                    if zone == 1005:
-                                        self.gearlist = entry['gear']
-                                        self.geardate = convert_time(encounter[1]['startTime'], dateonly=True, tz=self.timezone)
-                                    elif len(self.gearlist) < 1:
-                                        self.gearlist = entry['gear']
-                                        self.geardate = convert_time(encounter[1]['startTime'], dateonly=True, tz=self.timezone)
+                            self.playerrole = encounter['spec']
+                    if self.resolved(encounters[num:]):
+                        break
+                    if tablekeys[encounter['reportID']] in cachedtables:
+                        reporttable = cachedtables[tablekeys[encounter['reportID']]]
+                    else:
+                        reporttable = await reporttables[encounter['reportID']]
+                    entry = reporttable['players'].get(self.playername)
+                    if entry is not None:
+                        if 'spec' in entry and self.playerspec == "Not Available":
+                            self.playerspec = entry['spec']
+                        if 'icon' in entry and self.playerspec == "Not Available" and len(entry['icon'].split('-')) == 2:
+                            self.playerclass = entry['icon'].split('-')[0]
+                            self.playerspec = entry['icon'].split('-')[1]
+                        if 'class' in entry and self.playerclass == "Not Available":
+                            self.playerclass = entry['class']
+                        if 'itemLevel' in entry and self.gearlevel == 0:
+                            self.gearlevel = entry['itemLevel']
+                        if 'gear' in entry:
+                            if len(entry['gear']) > 1:
+                                zone = BOSSREF[encounter['encounterName']]
+                                if zone == 1005:
+                                    self.gearlist = entry['gear']
+                                    self.geardate = convert_time(encounter['startTime'], dateonly=True, tz=self.timezone)
+                                elif len(self.gearlist) < 1:
+                                    self.gearlist = entry['gear']
+                                    self.geardate = convert_time(encounter['startTime'], dateonly=True, tz=self.timezone)
+            finally:
+                for task in reporttables.values():
+                    if not task.done():
+                        task.cancel()
             self.lastencounter = self.lastencounters[len(self.lastencounters) - 1][1]
             if self.playerrole == "Not Available" and self.playerspec.lower() in SPECROLES:
                 self.playerrole = SPECROLES[self.playerspec.lower()]
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3.8
+import signal
+import subprocess
+from configparser import ConfigParser
+from os import cpu_count, environ, path
+from sys import argv, executable, exit, stdout
+from time import monotonic, sleep
+
+from loguru import logger as log
+from processlock import PLock
+
+configfile = environ.get('WOWINFOBOT_CONFIG', '/etc/wowinfobot.cfg')
+botfile = path.join(path.dirname(path.abspath(__file__)), 'bot.py')
+restart_delay = 5
+
+
+def shard_ranges(shard_count, processes):
+    per, extra = divmod(shard_count, processes)
+    ranges = []
+    start = 0
+    for num in range(processes):
+        size = per + (1 if num < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start = start + size
+    return [shards for shards in ranges if shards]
+
+
+class Cluster:
+
+    def __init__(self, shard_count, processes, args=()):
+        self.shard_count = shard_count
+        self.ranges = shard_ranges(shard_count, processes)
+        self.args = list(args)
+        self.workers = {}
+        self.started = {}
+        self.stopping = False
+
+    def spawn(self, cluster_id):
+        shards = self.ranges[cluster_id]
+        env = dict(environ, WOWINFOBOT_CONFIG=configfile, WOWINFOBOT_CLUSTER_ID=str(cluster_id), WOWINFOBOT_SHARD_IDS=','.join(str(shard) for shard in shards), WOWINFOBOT_SHARD_COUNT=str(self.shard_count))
+        self.workers[cluster_id] = subprocess.Popen([executable, botfile] + self.args, env=env, cwd=path.dirname(botfile))
+        self.started[cluster_id] = monotonic()
+        log.info(f'Cluster [{cluster_id}] started on pid [{self.workers[cluster_id].pid}] with shards {shards}')
+
+    def run(self):
+        for cluster_id in range(len(self.ranges)):
+            self.spawn(cluster_id)
+        while not self.stopping:
+            for cluster_id, worker in list(self.workers.items()):
+                if worker.poll() is not None and not self.stopping:
+                    log.warning(f'Cluster [{cluster_id}] exited with code [{worker.returncode}]')
+                    if monotonic() - self.started[cluster_id] < restart_delay:
+                        sleep(restart_delay)
+                    self.spawn(cluster_id)
+            sleep(1)
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        log.warning(f'Termination signal [{signum}] caught. Stopping {len(self.workers)} clusters...')
+        for worker in self.workers.values():
+            if worker.poll() is None:
+                worker.send_signal(signal.SIGTERM)
+        for cluster_id, worker in self.workers.items():
+            try:
+                worker.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                log.error(f'Cluster [{cluster_id}] did not exit, killing pid [{worker.pid}]')
+                worker.kill()
+        log.info('Exiting.')
+        exit(0)
+
+
+if __name__ == '__main__':
+    log.remove()
+    log.add(sink=stdout, level="INFO", format="<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green>| <level>{level: <8}</level> | <level>{message}</level>", colorize=True)
+
+    if not path.exists(configfile):
+        log.error(f"Config file: {configfile} doesn't exist. Exiting.")
+        exit(1)
+
+    systemconfig = ConfigParser()
+    systemconfig.read(configfile)
+    processes = systemconfig.getint("cluster", "processes", fallback=cpu_count() or 1)
+    shard_count = systemconfig.getint("cluster", "shards", fallback=processes)
+
+    processlock = PLock()
+    processlock.lock()
+
+    cluster = Cluster(shard_count, min(processes, shard_count), argv[1:])
+    signal.signal(signal.SIGTERM, cluster.stop)
+    signal.signal(signal.SIGINT, cluster.stop)
+    cluster.run()
@@ -3,7 +3,7 @@ FAIL_COLOR = 0xFF0000
 INFO_COLOR = 0x0088FF
 HELP_COLOR = 0xFF8800
 
-VALID_COMMANDS = ('help', 'player', 'lastraids', 'lastraid', 'wownews', 'warcraftnews', 'commands', 'helpme', 'playergear', 'playeritems', 'price', 'itemprice', 'item', 'raids', 'news', 'settings', 'admin', 'gear', 'setup', 'playerinfo', 'iteminfo', 'status', 'server', 'serverstatus', 'wizard', 'setupwizard')
+COMMAND_ALIASES = {'lastraids': ('raids', 'lastraids', 'lastraid'), 'news': ('news', 'wownews', 'warcraftnews'), 'help': ('help', 'commands', 'helpme'), 'setting': ('settings',), 'playerinfo': ('player', 'playerinfo', 'pinfo'), 'playergear': ('gear', 'playergear', 'playeritems'), 'item': ('item', 'price', 'itemprice', 'iteminfo'), 'status': ('server', 'status', 'serverstatus'), 'admin': ('admin',), 'setup': ('setup', 'setupwizard', 'wizard')}
 
 COMMAND_PREFIXES = {1: ["?", "Question Mark"], 2: [".", "Period"], 3: ["!", "Exclimation Point"], 4: ["#", "Pound"], 5: ["\\", "Backslash"], 6: ["%", "Percent"], 7: ["-", "Minus"], 8: ["$", "Dollar Sign"], 9: ["&", "Ampersand"], 10: ["*", "Asterisk"], 11: ["^", "Carat"], 12: [">", "Greater Than"]}
 
@@ -15,6 +15,10 @@ ROLES = ['Tank', 'Healer', 'DPS']
 
 SPECROLES = {'fire': 'DPS', 'frost': 'DPS'}
 
+FETCH_CONCURRENCY = 6
+
+RATE_LIMITS = {'warcraftlogs': (5, 20), 'blizzard': (10, 100), 'nexus': (5, 10)}
+
 BZONE = {1001: 1, 1003: 9, 1000: 10, 1004: 6, 1002: 8, 1005: 9}
 
 RZONE = {1005: "Ahn'Qiraj 40", 1002: "Blackwing Lair", 1004: "Ahn'Qiraj 20", 1000: "Molten Core", 1003: "Zul'Gurub", 1001: "Onyxia"}
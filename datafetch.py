@@ -1,206 +1,442 @@
 import asyncio
 import json
 from http.client import responses
+from random import uniform
+from time import monotonic, time
 from urllib import parse
 
 import aiohttp
+import msgpack
 from loguru import logger as log
 from prettyprinter import pprint
+from circuitbreaker import UNAVAILABLE, circuit
+from latency import latency
+import metrics
+from tracing import span
+import usage
+from ratelimit import priority
+import tape
 
+BLIZZARD_URL = 'https://{region}.api.blizzard.com'
+BLIZZARD_AUTHURL = 'https://{region}.battle.net/oauth/token'
 
-class BlizzardAPI:
+RATE_RETRIES = 3
+RETRIES = 2
+RETRY_BACKOFF = 0.2
 
-    def __init__(self, client_id, client_secret, region):
+
+class BlizzardTokenStore:
+
+    def __init__(self, redis=None, margin=60, ahead=900):
+        self.redis = redis
+        self.margin = margin
+        self.ahead = ahead
+        self.tokens = {}
+        self.pending = {}
+
+    async def get(self, client):
+        key = (client.client_id, client.region)
+        token = self.tokens.get(key)
+        if token is not None and token['expires'] - self.margin > time():
+            if token['expires'] - self.ahead <= time():
+                self._refresh(client, key, cached=False)
+            return token['access_token']
+        return await asyncio.shield(self._refresh(client, key))
+
+    async def invalidate(self, client, access_token):
+        key = (client.client_id, client.region)
+        token = self.tokens.get(key)
+        if token is None or token['access_token'] != access_token:
+            return None
+        del self.tokens[key]
+        log.debug(f'BlizzardAPI token rejected for [{client.region}], dropping it')
+        if self.redis is not None:
+            try:
+                await self.redis.redis.delete(f'blizzardtoken-{client.region}-{client.client_id}')
+            except:
+                log.exception(f'Error removing blizzard token from cache')
+
+    def _refresh(self, client, key, cached=True):
+        task = self.pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(client, key, cached))
+            self.pending[key] = task
+            task.add_done_callback(lambda t: self.pending.pop(key, None))
+        return task
+
+    async def _fetch(self, client, key, cached):
+        rkey = f'blizzardtoken-{client.region}-{client.client_id}'
+        if cached and self.redis is not None:
+            try:
+                stored = await self.redis.redis.get(rkey)
+            except:
+                log.exception(f'Error reading blizzard token from cache')
+                stored = None
+            if stored is not None:
+                token = msgpack.unpackb(stored)
+                if token['expires'] - self.ahead > time():
+                    log.trace(f'BlizzardAPI token cache HIT! for [{client.region}]')
+                    self.tokens[key] = token
+                    return token['access_token']
+        resp = await client._request_token()
+        if resp is None:
+            return None
+        token = {'access_token': resp['access_token'], 'expires': time() + int(resp.get('expires_in', 86399))}
+        self.tokens[key] = token
+        if self.redis is not None:
+            try:
+                await self.redis.redis.set(rkey, msgpack.packb(token), ex=max(int(token['expires'] - time() - self.margin), 1))
+            except:
+                log.exception(f'Error writing blizzard token to cache')
+        log.debug(f'BlizzardAPI token refreshed for [{client.region}] expires in [{int(token["expires"] - time())}s]')
+        return token['access_token']
+
+
+class ClientManager:
+
+    def __init__(self, limit_per_host=10, dns_cache=300, keepalive=30, host_limits=None, tokens=None, limiter=None, retries=RETRIES, hedge=False):
+        self.tokens = tokens
+        self.limiter = limiter
+        self.retries = retries
+        self.hedge = hedge
+        self.limit_per_host = limit_per_host
+        self.dns_cache = dns_cache
+        self.keepalive = keepalive
+        self.host_limits = host_limits or {}
+        self.sessions = {}
+        self.clients = {}
+
+    def session(self, url):
+        host = parse.urlsplit(url).netloc
+        if host not in self.sessions or self.sessions[host].closed:
+            limit = self.host_limits.get(host, self.limit_per_host)
+            connector = aiohttp.TCPConnector(limit_per_host=limit, use_dns_cache=True, ttl_dns_cache=self.dns_cache, keepalive_timeout=self.keepalive)
+            self.sessions[host] = aiohttp.ClientSession(connector=connector)
+            log.trace(f'ClientManager web session started for [{host}] limit [{limit}]')
+        return self.sessions[host]
+
+    def warcraftlogs(self, url, api_key):
+        key = ('warcraftlogs', url, api_key)
+        if key not in self.clients:
+            self.clients[key] = WarcraftLogsAPI(url, api_key, session=self.session(url), limiter=self.limiter, retries=self.retries, hedge=self.hedge)
+        return self.clients[key]
+
+    def blizzard(self, client_id, client_secret, region):
+        key = ('blizzard', client_id, client_secret, region.lower())
+        if key not in self.clients:
+            session = self.session(BLIZZARD_URL.format(region=region.lower()))
+            authsession = self.session(BLIZZARD_AUTHURL.format(region=region.lower()))
+            self.clients[key] = BlizzardAPI(client_id, client_secret, region, session=session, authsession=authsession, tokens=self.tokens, limiter=self.limiter, retries=self.retries, hedge=self.hedge)
+        return self.clients[key]
+
+    def nexus(self, url):
+        key = ('nexus', url)
+        if key not in self.clients:
+            self.clients[key] = NexusAPI(url, session=self.session(url), limiter=self.limiter, retries=self.retries, hedge=self.hedge)
+        return self.clients[key]
+
+    async def close(self):
+        for host, session in self.sessions.items():
+            if not session.closed:
+                await session.close()
+                log.trace(f'ClientManager web session ended for [{host}]')
+        self.sessions = {}
+        self.clients = {}
+        await asyncio.sleep(0.25)
+
+
+class APIClient:
+
+    name = 'API'
+    api = None
+
+    def __init__(self, url, session=None, limiter=None, key=None, retries=RETRIES, hedge=False):
+        self.url = url
+        self.key = key
+        self.limiter = limiter
+        self.retries = retries
+        self.hedge = hedge
+        self.owned = session is None
+        self.session = session if session is not None else aiohttp.ClientSession()
+        log.trace(f'{self.name} web session started')
+
+    async def close(self):
+        if self.owned and self.session is not None:
+            log.trace(f'{self.name} web session ended')
+            await self.session.close()
+
+    def _params(self, params):
+        return params
+
+    def _result(self, resp):
+        return resp
+
+    async def _get(self, path, endpoint=None, **kwargs):
+        params = self._params(kwargs)
+        url = parse.urljoin(self.url, path)
+        stats = latency(f'{self.api}:{endpoint or path}')
+        bucket = self.limiter.bucket(self.api, self.key) if self.limiter is not None else None
+        breaker = circuit(self.api)
+        limited = 0
+        retried = 0
+        while True:
+            if not breaker.allow():
+                log.debug(f'{self.name} circuit open, failing fast {url}')
+                return json.loads(json.dumps([{'error': UNAVAILABLE}]))
+            try:
+                if bucket is not None:
+                    with span('ratelimit.wait', api=self.api):
+                        await bucket.acquire(priority.get())
+                log.trace(f'{self.name} Retreiving URL: {url}')
+                with span(stats.name, retry=retried, limited=limited) as upstream:
+                    status, headers, resp = await self._send(url, params, stats, bucket)
+                    upstream.set(status=status)
+            except asyncio.exceptions.TimeoutError:
+                log.warning(f'{self.name} Timeout Error! [{stats.timeout():.1f}s] {url}')
+                breaker.record(False)
+                error = 'timeout'
+            except aiohttp.ClientError:
+                log.exception(f'{self.name} Connection Error! {url}')
+                breaker.record(False)
+                error = 'connection'
+            except ValueError:
+                log.exception(f'{self.name} Invalid response body! {url}')
+                breaker.record(False)
+                error = 'decode'
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except Exception:
+                breaker.record(False)
+                raise
+            else:
+                log.trace(f'{self.name} HTTP Response: {status}')
+                breaker.record(status < 500)
+                if bucket is not None:
+                    delay = bucket.observe(status, headers)
+                    if status == 429 and limited < RATE_RETRIES:
+                        limited = limited + 1
+                        log.warning(f'{self.name} rate limited, queued for [{delay:.1f}s] {url}')
+                        continue
+                if status < 500:
+                    return self._response(status, resp, url)
+                log.warning(f'{self.name} server error [{status}] [{responses.get(status)}] {url}')
+                error = status
+            if retried >= self.retries:
+                return json.loads(json.dumps([{'error': error}]))
+            retried = retried + 1
+            backoff = uniform(0, RETRY_BACKOFF * 2 ** retried)
+            log.debug(f'{self.name} retry [{retried}/{self.retries}] in [{backoff:.2f}s] {url}')
+            await asyncio.sleep(backoff)
+
+    def _response(self, status, resp, url):
+        if status == 200:
+            return self._result(resp)
+        elif status == 401:
+            log.warning(f'{self.name} Failed Request [{responses.get(status)}] api:{self.key} {url}')
+        elif status - 400 >= 0 and status - 400 < 100:
+            log.debug(f'{self.name} client error [{status}] [{responses.get(status)}] {url}')
+        else:
+            log.error(f'{self.name} UNKNOWN ERROR! [{status}] [{responses.get(status)}] {url}')
+        return json.loads(json.dumps([{'error': status}]))
+
+    async def _send(self, url, params, stats, bucket):
+        first = asyncio.ensure_future(self._attempt(url, params, stats))
+        tasks = {first}
+        try:
+            delay = stats.quantile(0.95) if self.hedge else None
+            if delay is not None:
+                done, pending = await asyncio.wait(tasks, timeout=delay)
+                if not done and (bucket is None or bucket.try_acquire()):
+                    log.trace(f'{self.name} hedging request after [{delay:.2f}s] {url}')
+                    tasks.add(asyncio.ensure_future(self._attempt(url, params, stats)))
+            while True:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                if len(tasks) == 0:
+                    return done.pop().result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _attempt(self, url, params, stats):
+        timeout = stats.timeout()
+        start = monotonic()
+        status = 'error'
+        usage.record(usage.UPSTREAM, self.api, self.key)
+        try:
+            if tape.replaying():
+                status, headers, resp = await asyncio.wait_for(tape.replay(self.api, url, params), timeout)
+                stats.add(monotonic() - start)
+                return status, headers, resp
+            async with self.session.get(url, params=params, timeout=timeout) as response:
+                status = response.status
+                resp = await response.json() if response.status == 200 else None
+                stats.add(monotonic() - start)
+                if tape.capturing():
+                    tape.record(self.api, stats.name, url, params, status, response.headers, resp, monotonic() - start)
+                return response.status, response.headers, resp
+        except asyncio.exceptions.TimeoutError:
+            status = 'timeout'
+            stats.add(timeout)
+            if tape.capturing():
+                tape.record(self.api, stats.name, url, params, tape.TIMEOUT, {}, None, timeout)
+            raise
+        except asyncio.CancelledError:
+            status = 'cancelled'
+            raise
+        finally:
+            metrics.observe('wowinfobot_upstream_request_seconds', monotonic() - start, api=self.api, endpoint=stats.name)
+            metrics.inc('wowinfobot_upstream_requests_total', api=self.api, endpoint=stats.name, status=status)
+
+
+class BlizzardAPI(APIClient):
+
+    name = 'BlizzardAPI'
+    api = 'blizzard'
+
+    def __init__(self, client_id, client_secret, region, session=None, authsession=None, tokens=None, limiter=None, retries=RETRIES, hedge=False):
+        self.tokens = tokens
         self.client_id = client_id
         self.client_secret = client_secret
         self.region = region.lower()
-        self.url = f'https://{self.region}.api.blizzard.com'
-        self.authurl = f'https://{self.region}.battle.net/oauth/token'
+        self.authurl = BLIZZARD_AUTHURL.format(region=self.region)
         self.namespace = f'dynamic-classic-{self.region}'
-        auth = aiohttp.BasicAuth(login=self.client_id, password=self.client_secret, encoding='utf-8')
-        self.session = aiohttp.ClientSession(auth=auth)
-        log.trace(f'BlizzrdAPI web session started')
-
-    def close(self):
-        if self.session is not None:
-            log.trace(f'BlizzrdAPI web session ended')
-            return self.session.close()
+        self.access_token = None
+        super().__init__(BLIZZARD_URL.format(region=self.region), session=session, limiter=limiter, key=client_id, retries=retries, hedge=hedge)
+        self.authsession = authsession if authsession is not None else self.session
 
     async def authorize(self):
+        if self.tokens is not None:
+            self.access_token = await self.tokens.get(self)
+        else:
+            resp = await self._request_token()
+            if resp is not None:
+                self.access_token = resp['access_token']
+
+    async def _request_token(self):
+        if tape.replaying():
+            return {'access_token': 'replay', 'expires_in': 86399}
         form = aiohttp.FormData()
         form.add_field('grant_type', 'client_credentials')
-        async with self.session.post(self.authurl, data=form, timeout=5) as response:
-            resp = await response.json()
-            respcode = response.status
+        auth = aiohttp.BasicAuth(login=self.client_id, password=self.client_secret, encoding='utf-8')
+        try:
+            async with self.authsession.post(self.authurl, data=form, auth=auth, timeout=5) as response:
+                resp = await response.json()
+                respcode = response.status
+        except asyncio.exceptions.TimeoutError:
+            log.error(f'BlizzardAPI Timeout Error retrieving access token!')
+            return None
+        except aiohttp.ClientError:
+            log.exception(f'BlizzardAPI Error retrieving access token!')
+            return None
         if respcode == 200 and 'access_token' in resp:
-            self.access_token = resp['access_token']
-            await self.session.close()
-            self.session = aiohttp.ClientSession()
             log.debug('BlizzrdAPI session authorized token recieved')
+            return resp
         else:
             log.error(f'Error retrieving blizzard access token')
-            await self.session.close()
+            return None
 
     async def _get(self, path, **kwargs):
-        params = {"access_token": self.access_token, "namespace": self.namespace, "region": self.region}
-        params.update(kwargs)
-        url = parse.urljoin(self.url, path)
-        log.trace(f'BlizzardAPI Retreiving URL: {url}')
-        try:
-            async with self.session.get(url, params=params, timeout=5) as response:
-                log.trace(f'BlizzardAPI HTTP Response: {response.status}')
-                if response.status == 200:
-                    return await response.json()
-                elif response.status == 401:
-                    log.warning(f'BlizzardAPI Failed Request [{responses[response.status]}] api:{self.api_key} {url}')
-                    return json.loads(json.dumps([{'error': response.status}]))
-                elif response.status - 400 >= 0 and response.status - 400 < 100:
-                    log.debug(f'BlizzardAPI client error [{response.status}] [{responses[response.status]}] {url}')
-                    return json.loads(json.dumps([{'error': response.status}]))
-                elif response.status - 500 >= 0 and response.status - 500 < 100:
-                    log.warning(f'BlizzardAPI server error [{response.status}] [{responses[response.status]}] {url}')
-                    return json.loads(json.dumps([{'error': response.status}]))
-                else:
-                    log.error(f'BlizzardAPI UNKNOWN ERROR! [{response.status}] [{responses[response.status]}] {url}')
-                    return json.loads(json.dumps([{'error': response.status}]))
-        except asyncio.exceptions.TimeoutError:
-            log.error(f'BlizzardAPI Timeout Error!')
-            return json.loads(json.dumps([{'error': 'timeout'}]))
+        for attempt in range(2):
+            if self.access_token is None:
+                await self.authorize()
+            if self.access_token is None:
+                log.error(f'{self.name} No access token, not sending request for {path}')
+                return json.loads(json.dumps([{'error': 401}]))
+            access_token = self.access_token
+            resp = await super()._get(path, **kwargs)
+            if resp != [{'error': 401}]:
+                return resp
+            self.access_token = None
+            if self.tokens is not None:
+                await self.tokens.invalidate(self, access_token)
+        return resp
+
+    def _params(self, params):
+        return dict({"access_token": self.access_token, "namespace": self.namespace, "region": self.region}, **params)
 
     async def realm_list(self):
         path = "/data/wow/realm/index"
-        return await self._get(path)
+        return await self._get(path, endpoint='realm_list')
 
     async def realm_info(self, slug):
         path = f"/data/wow/realm/{slug}"
-        return await self._get(path)
+        return await self._get(path, endpoint='realm_info')
 
     async def realm_status(self, realm_id):
         path = f"/data/wow/connected-realm/{realm_id}"
-        return await self._get(path)
+        return await self._get(path, endpoint='realm_status')
 
 
-class WarcraftLogsAPI:
+class WarcraftLogsAPI(APIClient):
 
-    def __init__(self, url, api_key):
-        self.url = url
+    name = 'WarcraftLogsAPI'
+    api = 'warcraftlogs'
+
+    def __init__(self, url, api_key, session=None, limiter=None, retries=RETRIES, hedge=False):
         self.api_key = api_key
-        self.session = aiohttp.ClientSession()
-        log.trace(f'WarcraftlLogsAPI web session started')
+        super().__init__(url, session=session, limiter=limiter, key=api_key, retries=retries, hedge=hedge)
 
-    def close(self):
-        if self.session is not None:
-            log.trace(f'WarcraftlLogsAPI web session ended')
-            return self.session.close()
-
-    async def _get(self, path, **kwargs):
-        params = {"api_key": self.api_key}
-        params.update(kwargs)
-        url = parse.urljoin(self.url, path)
-        log.trace(f'WarcraftLogsAPI Retreiving URL: {url}')
-        try:
-            async with self.session.get(url, params=params, timeout=5) as response:
-                log.trace(f'WarcraftLogsAPI HTTP Response: {response.status}')
-                if response.status == 200:
-                    return await response.json()
-                elif response.status == 401:
-                    log.warning(f'WarcraftLogsAPI Failed Request [{responses[response.status]}] api:{self.api_key} {url}')
-                    return json.loads(json.dumps([{'error': response.status}]))
-                elif response.status - 400 >= 0 and response.status - 400 < 100:
-                    log.debug(f'WarcraftLogsAPI client error [{response.status}] [{responses[response.status]}] {url}')
-                    return json.loads(json.dumps([{'error': response.status}]))
-                elif response.status - 500 >= 0 and response.status - 500 < 100:
-                    log.warning(f'WarcraftLogsAPI server error [{response.status}] [{responses[response.status]}] {url}')
-                    return json.loads(json.dumps([{'error': response.status}]))
-                else:
-                    log.error(f'WarcraftLogsAPI UNKNOWN ERROR! [{response.status}] [{responses[response.status]}] {url}')
-                    return json.loads(json.dumps([{'error': response.status}]))
-        except asyncio.exceptions.TimeoutError:
-            log.error(f'WarcraftLogsAPI Timeout Error!')
-            return json.loads(json.dumps([{'error': 'timeout'}]))
+    def _params(self, params):
+        return dict({"api_key": self.api_key}, **params)
 
     async def guild(self, name, server, region, **params):
         path = "reports/guild/{}/{}/{}".format(name, server, region)
-        return await self._get(path, **params)
+        return await self._get(path, endpoint='guild', **params)
 
     async def parses(self, name, server, region, **params):
         path = "parses/character/{}/{}/{}".format(name, server, region)
-        return await self._get(path, **params)
+        return await self._get(path, endpoint='parses', **params)
 
     async def fights(self, code, **params):
         path = "report/fights/{}".format(code)
-        return await self._get(path, **params)
+        return await self._get(path, endpoint='fights', **params)
 
     async def tables(self, view, code, **params):
         path = "report/tables/{}/{}".format(view, code)
-        return await self._get(path, **params)
+        return await self._get(path, endpoint='tables', **params)
 
     async def events(self, view, code, **params):
         path = "report/events/{}/{}".format(view, code)
-        return await self._get(path, **params)
+        return await self._get(path, endpoint='events', **params)
 
 
-class NexusAPI:
+class NexusAPI(APIClient):
 
-    def __init__(self, url):
-        self.url = url
-        self.session = aiohttp.ClientSession()
-        log.trace(f'NexusAPI web session started')
+    name = 'NexusAPI'
+    api = 'nexus'
 
-    def close(self):
-        if self.session is not None:
-            log.trace(f'NexusAPI web session ended')
-            return self.session.close()
+    def __init__(self, url, session=None, limiter=None, retries=RETRIES, hedge=False):
+        super().__init__(url, session=session, limiter=limiter, retries=retries, hedge=hedge)
 
-    async def _get(self, path, **kwargs):
-        params = kwargs
-        url = parse.urljoin(self.url, path)
-        log.trace(f'NexusAPI Retreiving URL: {url}')
-        try:
-            async with self.session.get(url, params=params, timeout=5) as response:
-                log.trace(f'NexusAPI HTTP Response: {response.status}')
-                if response.status == 200:
-                    respo = await response.json()
-                    if len(respo) == 0:
-                        return json.loads(json.dumps([{'error': 400}]))
-                    else:
-                        return respo
-                elif response.status == 401:
-                    log.warning(f'NexusAPI Failed Request [{responses[response.status]}] api:{self.api_key} {url}')
-                    return json.loads(json.dumps([{'error': response.status}]))
-                elif response.status - 400 >= 0 and response.status - 400 < 100:
-                    log.debug(f'NexusAPI client error [{response.status}] [{responses[response.status]}] {url}')
-                    return json.loads(json.dumps([{'error': response.status}]))
-                elif response.status - 500 >= 0 and response.status - 500 < 100:
-                    log.warning(f'NexusAPI server error [{response.status}] [{responses[response.status]}] {url}')
-                    return json.loads(json.dumps([{'error': response.status}]))
-                else:
-                    log.error(f'NexusAPI UNKNOWN ERROR! [{response.status}] [{responses[response.status]}] {url}')
-                    return json.loads(json.dumps([{'error': response.status}]))
-        except asyncio.exceptions.TimeoutError:
-            log.error(f'WarcraftLogsAPI Timeout Error!')
-            return json.loads(json.dumps([{'error': 'timeout'}]))
+    def _result(self, resp):
+        if len(resp) == 0:
+            return json.loads(json.dumps([{'error': 400}]))
+        return resp
 
     async def price(self, itemid, server, faction, **params):
         path = f"items/{server.lower()}-{faction.lower()}/{itemid}"
-        return await self._get(path, **params)
+        return await self._get(path, endpoint='price', **params)
 
     async def search(self, **params):
         path = f"search"
-        return await self._get(path, **params)
+        return await self._get(path, endpoint='search', **params)
 
     async def content(self, **params):
         path = f"content"
-        return await self._get(path, **params)
+        return await self._get(path, endpoint='content', **params)
 
     async def news(self, **params):
         path = f"news"
-        return await self._get(path, **params)
+        return await self._get(path, endpoint='news', **params)
 
     async def deals(self, server, **params):
         path = f"crafting/{server.lower()}/deals"
-        return await self._get(path, **params)
+        return await self._get(path, endpoint='deals', **params)
 
     async def crafting(self, itemid, server, **params):
         path = f"crafting/{server.lower()}/{itemid}"
-        return await self._get(path, **params)
+        return await self._get(path, endpoint='crafting', **params)
@@ -0,0 +1,64 @@
+from functools import lru_cache
+
+from fuzzywuzzy import fuzz
+from loguru import logger as log
+
+FUZZY_COMMAND_ERROR = 75
+FUZZY_MEMO_SIZE = 2048
+
+
+@lru_cache(maxsize=FUZZY_MEMO_SIZE)
+def fuzzycmdlookup(cmd, commands):
+    ratios = {}
+    for command in commands:
+        ratio = fuzz.ratio(command, cmd)
+        ratios[command] = ratio
+    v = list(ratios.values())
+    k = list(ratios.keys())
+    if max(v) >= FUZZY_COMMAND_ERROR:
+        if max(v) != 100:
+            log.debug(f'Fuzzy cmd lookup: {sorted(ratios.items())}')
+            log.info(f'Fuzzy command fixed [{cmd} -> {k[v.index(max(v))]}] [{max(v)}%]')
+        return k[v.index(max(v))]
+    else:
+        log.debug(f'Fuzzy cmd lookup: {sorted(ratios.items())}')
+        return None
+
+
+class Command:
+
+    def __init__(self, name, handler, dm_only=False, permission=None):
+        self.name = name
+        self.handler = handler
+        self.dm_only = dm_only
+        self.permission = permission
+
+    def allowed(self, user, is_dm):
+        if self.dm_only and not is_dm:
+            return False
+        if self.permission is not None and not user[self.permission]:
+            return False
+        return True
+
+
+class CommandRegistry:
+
+    def __init__(self):
+        self.aliases = {}
+        self.names = ()
+
+    def register(self, handler, aliases, dm_only=False, permission=None):
+        command = Command(handler.__name__, handler, dm_only=dm_only, permission=permission)
+        for alias in aliases:
+            self.aliases[alias] = command
+        self.names = tuple(sorted(self.aliases))
+        return command
+
+    def resolve(self, cmd):
+        cmd = cmd.lower()
+        command = self.aliases.get(cmd)
+        if command is None and len(cmd) != 1:
+            fixed = fuzzycmdlookup(cmd, self.names)
+            if fixed is not None:
+                command = self.aliases.get(fixed)
+        return command
@@ -0,0 +1,40 @@
+from math import trunc
+
+
+def truncate_float(number, digits):
+    if not isinstance(number, (float, str)):
+        number = float(number)
+    if not isinstance(digits, int):
+        raise TypeError(f"Digits value must be type int, not {type(digits)}")
+    if isinstance(number, str):
+        number = float(number)
+    stepper = 10.0 ** abs(digits)
+    return trunc(stepper * number) / stepper
+
+
+def convertprice(rawprice):
+    if rawprice is None:
+        return 'Not Available'
+    if rawprice == 'Not Available':
+        return 'Not Available'
+    if rawprice < 100:
+        return f'{rawprice}c'
+    elif rawprice >= 100 and rawprice < 10000:
+        silver = int(str(rawprice)[:-2])
+        copper = int(str(rawprice)[-2:])
+        return f'{silver}s {copper}c'
+    elif rawprice >= 10000:
+        silver = int(str(rawprice)[:-2])
+        silver = int(str(silver)[-2:])
+        copper = int(str(rawprice)[-2:])
+        gold = int(str(rawprice)[:-4])
+        return f'{gold}g {silver}s {copper}c'
+
+
+def filter_details(name, tags, labels):
+    details = []
+    for line in labels:
+        label = line['label']
+        if label != 'Sell Price:' and not label.startswith('Item Level') and not label.startswith('Requires Level') and label not in tags and label != name:
+            details.append(label)
+    return details
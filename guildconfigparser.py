@@ -4,6 +4,8 @@ import aredis
 import msgpack
 from loguru import logger as log
 
+from cachemanager import INSTANCE_ID, listen
+
 DISCORD_OPTIONS = {'command_prefix': 'None', 'setupran': 'False', 'setupadmin': 'None', 'setupadmin_id': 0, 'admin_role_id': 0, 'admin_role': 'None', 'user_role_id': 0, 'user_role': 'None', 'pm_only': 'True', 'limit_to_channel': 'None', 'limit_to_channel_id': 0}
 
 SERVER_OPTIONS = {'server_name': 'None', 'server_region': 'None', 'server_timezone': 'None', 'server_id': 0, 'server_slug': 'None', 'guild_name': 'None', 'faction': 'None', 'server_type': 'None', 'server_locale': 'None', 'server_region_name': 'None'}
@@ -12,6 +14,19 @@ WARCRAFTLOGS_OPTIONS = {"api_key": "None"}
 
 BLIZZARD_OPTIONS = {'client_id': 'None', 'client_secret': 'None'}
 
+CONFIG_CHANNEL = 'guildconfig-invalidate'
+
+configcache = {}
+
+
+def _invalidate(guild_id):
+    log.trace(f'Guild config cache invalidated for [{guild_id}]')
+    configcache.pop(guild_id, None)
+
+
+async def config_listener(redis):
+    await listen(redis, CONFIG_CHANNEL, _invalidate, reset=configcache.clear)
+
 
 class GuildConfigParser(RawConfigParser):
 
@@ -21,6 +36,10 @@ class GuildConfigParser(RawConfigParser):
         self.guild_id = guild_id
 
     async def read(self):
+        cached = configcache.get(str(self.guild_id))
+        if cached is not None:
+            self.read_dict(cached)
+            return None
         if len(self.redis.pool._available_connections) == 0 or not self.redis.connected:
             await self.redis.connect()
         read_config = await self.redis.redis.get(self.guild_id)
@@ -30,11 +49,19 @@ class GuildConfigParser(RawConfigParser):
         else:
             self.read_dict(msgpack.unpackb(read_config))
             await self._check_defaults()
+        configcache[str(self.guild_id)] = self._snapshot()
 
     async def write(self):
         if len(self.redis.pool._available_connections) == 0 or not self.redis.connected:
             await self.redis.connect()
-        await self.redis.redis.set(self.guild_id, msgpack.packb(self._sections))
+        pipe = await self.redis.redis.pipeline(transaction=False)
+        await pipe.set(self.guild_id, msgpack.packb(self._sections))
+        await pipe.publish(CONFIG_CHANNEL, f'{INSTANCE_ID}:{self.guild_id}')
+        await pipe.execute()
+        configcache[str(self.guild_id)] = self._snapshot()
+
+    def _snapshot(self):
+        return {section: dict(options) for section, options in self._sections.items()}
 
     async def _check_defaults(self):
         changes = False
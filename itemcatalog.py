@@ -0,0 +1,237 @@
+import json
+import mmap
+import os
+import re
+import struct
+import unicodedata
+from asyncio import get_event_loop, sleep
+from collections import Counter
+from difflib import SequenceMatcher
+from sys import argv
+
+from loguru import logger as log
+import metrics
+
+MAGIC = b'WIC1'
+HEADER = struct.Struct('<4sIII')
+RECORD = struct.Struct('<IIHH')
+TRIGRAM = struct.Struct('<3sII')
+POSTING = struct.Struct('<I')
+NONWORD = re.compile('[^a-z0-9]+')
+RECALL = 0.5
+CANDIDATES = 20
+
+
+def normalize(name):
+    name = unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode().lower().replace("'", '')
+    return ' '.join(NONWORD.sub(' ', name).split())
+
+
+def trigrams(name):
+    padded = f'  {name} '
+    return {padded[num:num + 3] for num in range(len(padded) - 2)}
+
+
+class ItemCatalog:
+
+    def __init__(self, filename, threshold=0.8):
+        self.filename = filename
+        self.threshold = threshold
+        self.map = None
+        self.count = 0
+        self.trigramcount = 0
+        self.added = {}
+        self.addedgrams = {}
+        self.open()
+
+    def open(self):
+        self.close()
+        if not os.path.exists(self.filename) or os.path.getsize(self.filename) < HEADER.size:
+            log.debug(f'Item catalog [{self.filename}] is empty, it will be built as items are seen')
+            return None
+        with open(self.filename, 'rb') as catalogfile:
+            self.map = mmap.mmap(catalogfile.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, trigramcount, namesize = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            log.error(f'Item catalog [{self.filename}] has an unknown format, ignoring it')
+            self.close()
+            return None
+        self.count = count
+        self.trigramcount = trigramcount
+        self.trigrams_at = HEADER.size + count * RECORD.size
+        self.postings_at = self.trigrams_at + trigramcount * TRIGRAM.size
+        self.names_at = len(self.map) - namesize
+        log.debug(f'Item catalog loaded [{count}] items from [{self.filename}]')
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.count = 0
+        self.trigramcount = 0
+
+    def __len__(self):
+        return self.count + len(self.added)
+
+    def _record(self, index):
+        return RECORD.unpack_from(self.map, HEADER.size + index * RECORD.size)
+
+    def _name(self, index):
+        itemid, offset, length, gramcount = self._record(index)
+        return self.map[self.names_at + offset:self.names_at + offset + length]
+
+    def _find(self, key):
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if self._name(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.count and self._name(low) == key:
+            return self._record(low)[0]
+        return None
+
+    def _postings(self, gram):
+        low, high = 0, self.trigramcount
+        while low < high:
+            mid = (low + high) // 2
+            if TRIGRAM.unpack_from(self.map, self.trigrams_at + mid * TRIGRAM.size)[0] < gram:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.trigramcount:
+            entry, offset, count = TRIGRAM.unpack_from(self.map, self.trigrams_at + low * TRIGRAM.size)
+            if entry == gram:
+                return struct.unpack_from(f'<{count}I', self.map, self.postings_at + offset * POSTING.size)
+        return ()
+
+    def _exact(self, key):
+        itemid = self.added.get(key)
+        if itemid is None and self.map is not None:
+            itemid = self._find(key.encode())
+        return itemid
+
+    def _fuzzy(self, key):
+        grams = trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            if self.map is not None:
+                shared.update(self._postings(gram.encode()))
+            shared.update(self.addedgrams.get(gram, ()))
+        best = None
+        bestscore = self.threshold
+        for candidate, count in shared.most_common(CANDIDATES):
+            if count / len(grams) < RECALL:
+                break
+            name = candidate if isinstance(candidate, str) else self._name(candidate).decode()
+            score = SequenceMatcher(None, key, name).ratio()
+            if score > bestscore or (score == bestscore and best is None):
+                best = candidate
+                bestscore = score
+        if best is None:
+            return None
+        return self.added[best] if isinstance(best, str) else self._record(best)[0]
+
+    def lookup(self, name):
+        key = normalize(name)
+        if key == '':
+            return None
+        itemid = self._exact(key)
+        if itemid is not None:
+            metrics.inc('wowinfobot_item_catalog_total', result='exact')
+            return itemid
+        itemid = self._fuzzy(key)
+        metrics.inc('wowinfobot_item_catalog_total', result='miss' if itemid is None else 'fuzzy')
+        return itemid
+
+    def add(self, itemid, name):
+        key = normalize(name)
+        if key == '' or self._exact(key) is not None:
+            return False
+        self.added[key] = int(itemid)
+        for gram in trigrams(key):
+            self.addedgrams.setdefault(gram, []).append(key)
+        log.trace(f'Item catalog added [{itemid}] [{key}]')
+        return True
+
+    def entries(self):
+        for index in range(self.count):
+            yield self._name(index).decode(), self._record(index)[0]
+        yield from self.added.items()
+
+    def seed(self, filename):
+        with open(filename, 'r') as seedfile:
+            items = json.load(seedfile)
+        added = sum(1 for item in items if 'itemId' in item and 'name' in item and self.add(item['itemId'], item['name']))
+        log.info(f'Item catalog seeded [{added}] new items from [{filename}]')
+        return added
+
+    def save(self):
+        added = dict(self.added)
+        if len(added) == 0:
+            return None
+        if self.write(added):
+            self.saved(added)
+
+    def write(self, added):
+        current = ItemCatalog(self.filename, self.threshold)
+        entries = dict(current.entries())
+        current.close()
+        entries.update(added)
+        names = sorted(entries)
+        records = []
+        blob = bytearray()
+        postings = {}
+        for index, name in enumerate(names):
+            encoded = name.encode()
+            grams = trigrams(name)
+            records.append(RECORD.pack(entries[name], len(blob), len(encoded), len(grams)))
+            blob += encoded
+            for gram in grams:
+                postings.setdefault(gram.encode(), []).append(index)
+        table = []
+        flat = []
+        for gram in sorted(postings):
+            table.append(TRIGRAM.pack(gram, len(flat), len(postings[gram])))
+            flat.extend(postings[gram])
+        tmpfile = f'{self.filename}.{os.getpid()}.tmp'
+        try:
+            with open(tmpfile, 'wb') as catalogfile:
+                catalogfile.write(HEADER.pack(MAGIC, len(names), len(table), len(blob)))
+                catalogfile.write(b''.join(records))
+                catalogfile.write(b''.join(table))
+                catalogfile.write(struct.pack(f'<{len(flat)}I', *flat))
+                catalogfile.write(blob)
+            os.replace(tmpfile, self.filename)
+        except:
+            log.exception(f'Error writing item catalog [{self.filename}]')
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+            return False
+        log.debug(f'Item catalog saved [{len(names)}] items to [{self.filename}]')
+        return True
+
+    def saved(self, added):
+        for key in added:
+            self.added.pop(key, None)
+        self.addedgrams = {}
+        for key in self.added:
+            for gram in trigrams(key):
+                self.addedgrams.setdefault(gram, []).append(key)
+        self.open()
+
+
+async def catalog_flusher(catalog, interval=300):
+    while True:
+        await sleep(interval)
+        added = dict(catalog.added)
+        if len(added) > 0 and await get_event_loop().run_in_executor(None, catalog.write, added):
+            catalog.saved(added)
+
+if __name__ == '__main__':
+    catalog = ItemCatalog(argv[1])
+    for filename in argv[2:]:
+        catalog.seed(filename)
+    catalog.save()
+    print(f'{len(catalog)} items in {argv[1]}')
@@ -0,0 +1,45 @@
+from collections import deque
+
+endpoints = {}
+settings = {'size': 200, 'minimum': 20, 'factor': 3, 'floor': 1, 'ceiling': 10, 'default': 5}
+
+
+class LatencyWindow:
+
+    def __init__(self, name, size=200, minimum=20, factor=3, floor=1, ceiling=10, default=5):
+        self.name = name
+        self.samples = deque(maxlen=size)
+        self.minimum = minimum
+        self.factor = factor
+        self.floor = floor
+        self.ceiling = ceiling
+        self.default = default
+        self.ordered = None
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.ordered = None
+
+    def quantile(self, q):
+        if len(self.samples) < self.minimum:
+            return None
+        if self.ordered is None:
+            self.ordered = sorted(self.samples)
+        return self.ordered[min(int(q * len(self.ordered)), len(self.ordered) - 1)]
+
+    def timeout(self):
+        p95 = self.quantile(0.95)
+        if p95 is None:
+            return self.default
+        return min(max(p95 * self.factor, self.floor), self.ceiling)
+
+
+def setup_latency(size, minimum, factor, floor, ceiling, default):
+    settings.update(size=size, minimum=minimum, factor=factor, floor=floor, ceiling=ceiling, default=default)
+    endpoints.clear()
+
+
+def latency(name):
+    if name not in endpoints:
+        endpoints[name] = LatencyWindow(name, **settings)
+    return endpoints[name]
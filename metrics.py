@@ -0,0 +1,130 @@
+import json
+from asyncio import sleep, wait_for
+from bisect import bisect_left
+from collections import defaultdict
+from time import monotonic
+
+from aiohttp import web
+from loguru import logger as log
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CACHE_FAMILIES = ('fights', 'tables', 'news')
+READY_TIMEOUT = 2
+
+counters = defaultdict(float)
+histograms = {}
+gauges = {}
+checks = {}
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(name, labels, value):
+    if labels:
+        pairs = ','.join(f'{label}="{_escape(lvalue)}"' for label, lvalue in labels)
+        return f'{name}{{{pairs}}} {value}'
+    return f'{name} {value}'
+
+
+def inc(name, value=1, **labels):
+    counters[(name, _labels(labels))] += value
+
+
+def observe(name, value, **labels):
+    key = (name, _labels(labels))
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+    index = bisect_left(BUCKETS, value)
+    if index < len(BUCKETS):
+        histogram[0][index] += 1
+    histogram[1] += value
+    histogram[2] += 1
+
+
+def gauge(name, callback):
+    gauges[name] = callback
+
+
+def readiness(name, check):
+    checks[name] = check
+
+
+def keyfamily(key):
+    family = key.split('-', 1)[0]
+    return family if family in CACHE_FAMILIES else 'parses'
+
+
+def render():
+    lines = []
+    typed = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in typed:
+            lines.append(f'# TYPE {name} counter')
+            typed.add(name)
+        lines.append(_format(name, labels, value))
+    for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+        if name not in typed:
+            lines.append(f'# TYPE {name} histogram')
+            typed.add(name)
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS, buckets):
+            cumulative = cumulative + bucket
+            lines.append(_format(f'{name}_bucket', labels + (('le', bound),), cumulative))
+        lines.append(_format(f'{name}_bucket', labels + (('le', '+Inf'),), count))
+        lines.append(_format(f'{name}_sum', labels, total))
+        lines.append(_format(f'{name}_count', labels, count))
+    for name, callback in sorted(gauges.items()):
+        try:
+            value = callback()
+        except:
+            log.exception(f'Error collecting gauge [{name}]')
+            continue
+        lines.append(f'# TYPE {name} gauge')
+        if isinstance(value, dict):
+            for labels, lvalue in sorted(value.items()):
+                lines.append(_format(name, labels, lvalue))
+        else:
+            lines.append(_format(name, (), value))
+    return '\n'.join(lines) + '\n'
+
+
+async def loop_lag(interval=1):
+    lag = {'seconds': 0.0}
+    gauge('wowinfobot_event_loop_lag_seconds', lambda: lag['seconds'])
+    while True:
+        start = monotonic()
+        await sleep(interval)
+        lag['seconds'] = max(monotonic() - start - interval, 0)
+
+
+async def _metrics(request):
+    return web.Response(text=render(), content_type='text/plain', charset='utf-8', headers={'X-Content-Type-Options': 'nosniff'})
+
+
+async def _ready(request):
+    results = {}
+    for name, check in checks.items():
+        try:
+            results[name] = bool(await wait_for(check(), READY_TIMEOUT))
+        except:
+            results[name] = False
+    status = 200 if all(results.values()) else 503
+    return web.Response(text=json.dumps(results), content_type='application/json', status=status)
+
+
+async def start_server(host, port):
+    app = web.Application()
+    app.router.add_get('/metrics', _metrics)
+    app.router.add_get('/ready', _ready)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log.info(f'Metrics endpoint listening on [{host}:{port}]')
+    return runner
@@ -16,7 +16,7 @@ def cleanName(filename):
 
 
 class PLock:
-    def __init__(self):
+    def __init__(self, name=None):
         self.pid = str(os.getpid())
         if rundir.is_dir() and os.access(str(rundir), os.W_OK):
             self.lockdir = rundir
@@ -25,8 +25,9 @@ class PLock:
         else:
             log.critical("Cannot find a valid place to put the lockfile. Exiting")
             exit(1)
-        self.lockfile = self.lockdir / f"{cleanName(sys.argv[0])}.lock"
-        self.pidfile = self.lockdir / f"{cleanName(sys.argv[0])}.pid"
+        lockname = cleanName(sys.argv[0]) if name is None else f"{cleanName(sys.argv[0])}-{name}"
+        self.lockfile = self.lockdir / f"{lockname}.lock"
+        self.pidfile = self.lockdir / f"{lockname}.pid"
 
     def _aquirelock(self):
         if not self.lockfile.is_file():
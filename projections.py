@@ -0,0 +1,54 @@
+from cachemanager import iserror
+
+PLAYER_FIELDS = ('spec', 'icon', 'class', 'itemLevel')
+GEAR_FIELDS = ('id', 'name', 'slot', 'itemLevel', 'permanentEnchantName')
+
+
+def tables(resp):
+    if iserror(resp) or not isinstance(resp, dict):
+        return resp
+    players = {}
+    for entry in resp.get('entries', []):
+        if 'name' not in entry or entry['name'] in players:
+            continue
+        row = {field: entry[field] for field in PLAYER_FIELDS if field in entry}
+        if 'gear' in entry:
+            row['gear'] = [{field: item[field] for field in GEAR_FIELDS if field in item} for item in entry['gear']]
+        players[entry['name']] = row
+    return {'players': players}
+
+
+def fights(resp):
+    if iserror(resp) or not isinstance(resp, dict):
+        return resp
+    summary = {'kills': 0, 'wipes': 0, 'size': 0, 'lastboss': None}
+    for each in resp.get('fights', []):
+        if 'kill' in each:
+            if each['kill']:
+                summary['kills'] = summary['kills'] + 1
+                summary['lastboss'] = each['name']
+                summary['size'] = each['size']
+            else:
+                summary['wipes'] = summary['wipes'] + 1
+    return summary
+
+
+def fightsummary(fight):
+    if iserror(fight) or not isinstance(fight, dict):
+        return None
+    return fight['kills'], fight['wipes'], fight['size'], fight['lastboss']
+
+
+SCHEMAS = {'tables': (2, tables), 'fights': (2, fights)}
+
+
+def cachekey(endpoint, ident):
+    return f'{endpoint}-v{SCHEMAS[endpoint][0]}-{ident}'
+
+
+def projected(endpoint, fetcher):
+    project = SCHEMAS[endpoint][1]
+
+    async def fetch():
+        return project(await fetcher())
+    return fetch
@@ -0,0 +1,128 @@
+from asyncio import get_event_loop
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from heapq import heappop, heappush
+from itertools import count
+from time import monotonic, time
+
+from loguru import logger as log
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+DEFAULT_RETRY = 1
+MAX_BLOCK = 300
+
+priority = ContextVar('priority', default=INTERACTIVE)
+
+
+def retry_after(headers):
+    value = headers.get('Retry-After')
+    if value is not None:
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return parsedate_to_datetime(value).timestamp() - time()
+            except (TypeError, ValueError):
+                return DEFAULT_RETRY
+    remaining = headers.get('X-RateLimit-Remaining')
+    reset = headers.get('X-RateLimit-Reset')
+    if remaining is not None and reset is not None:
+        try:
+            if float(remaining) > 0:
+                return None
+            reset = float(reset)
+        except ValueError:
+            return None
+        return reset - time() if reset > 1e9 else reset
+    return None
+
+
+class TokenBucket:
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = monotonic()
+        self.blocked = 0
+        self.waiters = []
+        self.sequence = count()
+        self.wakeup = None
+
+    async def acquire(self, level=INTERACTIVE):
+        if len(self.waiters) == 0 and self._take():
+            return
+        future = get_event_loop().create_future()
+        heappush(self.waiters, (level, next(self.sequence), future))
+        self._schedule()
+        await future
+
+    def try_acquire(self):
+        return len(self.waiters) == 0 and self._take()
+
+    def observe(self, status, headers):
+        delay = retry_after(headers)
+        if delay is None and status == 429:
+            delay = DEFAULT_RETRY
+        if delay is not None and delay > 0:
+            self.block(delay)
+        return delay
+
+    def block(self, seconds):
+        self.blocked = max(self.blocked, monotonic() + min(seconds, MAX_BLOCK))
+        self.tokens = 0
+        if self.wakeup is not None:
+            self.wakeup.cancel()
+            self.wakeup = None
+        if len(self.waiters) > 0:
+            self._schedule()
+
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _take(self):
+        self._refill()
+        if self.blocked > self.updated or self.tokens < 1:
+            return False
+        self.tokens = self.tokens - 1
+        return True
+
+    def _schedule(self):
+        if self.wakeup is None:
+            self._refill()
+            delay = max(self.blocked - self.updated, (1 - self.tokens) / self.rate, 0)
+            self.wakeup = get_event_loop().call_later(delay, self._dispatch)
+
+    def _dispatch(self):
+        self.wakeup = None
+        while len(self.waiters) > 0:
+            future = self.waiters[0][2]
+            if future.done():
+                heappop(self.waiters)
+            elif self._take():
+                heappop(self.waiters)
+                future.set_result(None)
+            else:
+                break
+        if len(self.waiters) > 0:
+            self._schedule()
+
+
+class RateLimiter:
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.buckets = {}
+
+    def bucket(self, api, key=None):
+        if api not in self.limits:
+            return None
+        if (api, key) not in self.buckets:
+            rate, burst = self.limits[api]
+            self.buckets[(api, key)] = TokenBucket(rate, burst)
+            log.trace(f'RateLimiter bucket created for [{api}] rate [{rate}/s] burst [{burst}]')
+        return self.buckets[(api, key)]
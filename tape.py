@@ -0,0 +1,130 @@
+import gzip
+from asyncio import TimeoutError, get_event_loop, sleep
+from collections import Counter, defaultdict, deque
+from statistics import median
+from sys import argv
+from threading import Lock
+from time import time
+from urllib import parse
+
+import msgpack
+from loguru import logger as log
+
+OFF = 'off'
+CAPTURE = 'capture'
+REPLAY = 'replay'
+TIMEOUT = 'timeout'
+SECRETS = ('api_key', 'access_token', 'client_secret')
+HEADERS = ('Retry-After', 'X-RateLimit-Remaining', 'X-RateLimit-Reset')
+FLUSH_INTERVAL = 5
+
+settings = {'mode': OFF, 'file': None, 'scale': 1.0}
+pending = []
+reels = {}
+writing = Lock()
+replaystats = Counter()
+
+
+def setup_tape(mode, filename, scale=1.0):
+    settings.update(mode=mode, file=filename, scale=scale)
+    if mode == REPLAY:
+        load(filename)
+        log.warning(f'Replaying upstream traffic from tape [{filename}] with [{sum(len(reel) for reel in reels.values())}] responses at [{scale}x] latency')
+    elif mode == CAPTURE:
+        log.warning(f'Capturing upstream traffic to tape [{filename}]')
+
+
+def capturing():
+    return settings['mode'] == CAPTURE
+
+
+def replaying():
+    return settings['mode'] == REPLAY
+
+
+def tapekey(api, url, params):
+    query = parse.urlencode(sorted((key, str(value)) for key, value in params.items() if key not in SECRETS and value is not None))
+    return f'{api} {parse.urlsplit(url).path}?{query}'
+
+
+def record(api, endpoint, url, params, status, headers, body, elapsed):
+    pending.append({'key': tapekey(api, url, params), 'api': api, 'endpoint': endpoint, 'time': time(), 'latency': round(elapsed, 6), 'status': status, 'headers': {name: headers[name] for name in HEADERS if name in headers}, 'body': body})
+
+
+def take():
+    records = list(pending)
+    pending.clear()
+    return records
+
+
+def write(records):
+    if len(records) == 0 or settings['file'] is None:
+        return None
+    try:
+        with writing, gzip.open(settings['file'], 'ab') as tapefile:
+            for entry in records:
+                tapefile.write(msgpack.packb(entry))
+        log.debug(f'Wrote [{len(records)}] upstream responses to tape [{settings["file"]}]')
+    except:
+        log.exception(f'Error writing upstream tape [{settings["file"]}]')
+
+
+def flush():
+    write(take())
+
+
+async def tape_flusher(interval=FLUSH_INTERVAL):
+    while True:
+        await sleep(interval)
+        if len(pending) > 0:
+            await get_event_loop().run_in_executor(None, write, take())
+
+
+def read(filename):
+    with gzip.open(filename, 'rb') as tapefile:
+        yield from msgpack.Unpacker(tapefile)
+
+
+def load(filenames):
+    reels.clear()
+    for filename in filenames.split(','):
+        for entry in read(filename.strip()):
+            reels.setdefault(entry['key'], deque()).append(entry)
+
+
+async def replay(api, url, params):
+    key = tapekey(api, url, params)
+    reel = reels.get(key)
+    if reel is None:
+        replaystats['miss'] += 1
+        log.warning(f'No tape entry for [{key}], answering 404')
+        return 404, {}, None
+    entry = reel[0]
+    reel.rotate(-1)
+    replaystats['hit'] += 1
+    if settings['scale'] > 0:
+        await sleep(entry['latency'] * settings['scale'])
+    if entry['status'] == TIMEOUT:
+        raise TimeoutError()
+    return entry['status'], entry['headers'], entry['body']
+
+
+def summary(filenames):
+    counts = Counter()
+    statuses = defaultdict(Counter)
+    latencies = defaultdict(list)
+    first = last = None
+    for filename in filenames:
+        for entry in read(filename):
+            counts[entry['endpoint']] += 1
+            statuses[entry['endpoint']][str(entry['status'])] += 1
+            latencies[entry['endpoint']].append(entry['latency'])
+            first = entry['time'] if first is None else min(first, entry['time'])
+            last = entry['time'] if last is None else max(last, entry['time'])
+    print(f'{sum(counts.values())} responses over {(last or 0) - (first or 0):.0f}s')
+    for endpoint, count in counts.most_common():
+        print(f'{endpoint:<30} {count:>7} {median(latencies[endpoint]) * 1000:>9.1f}ms {dict(statuses[endpoint])}')
+
+
+if __name__ == '__main__':
+    summary(argv[1:])
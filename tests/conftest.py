@@ -0,0 +1,118 @@
+from time import monotonic
+
+import pytest
+
+
+class FakeRedis:
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.published = []
+
+    def _alive(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    async def get(self, key):
+        return self.data[key] if self._alive(key) else None
+
+    async def set(self, key, value, ex=None, px=None, nx=False):
+        if nx and self._alive(key):
+            return None
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+        self.expires.pop(key, None)
+        if ex is not None:
+            self.expires[key] = monotonic() + ex
+        elif px is not None:
+            self.expires[key] = monotonic() + px / 1000
+        return True
+
+    async def delete(self, *keys):
+        removed = sum(1 for key in keys if self._alive(key))
+        for key in keys:
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return removed
+
+    async def exists(self, key):
+        return 1 if self._alive(key) else 0
+
+    async def pttl(self, key):
+        if not self._alive(key):
+            return -2
+        if key not in self.expires:
+            return -1
+        return int((self.expires[key] - monotonic()) * 1000)
+
+    async def eval(self, script, numkeys, key, token):
+        if self._alive(key) and self.data[key] == token.encode():
+            return await self.delete(key)
+        return 0
+
+    async def hset(self, key, field, value):
+        self.data.setdefault(key, {})[str(field).encode()] = value
+        return 1
+
+    async def hdel(self, key, *fields):
+        mapping = self.data.get(key, {})
+        return sum(1 for field in fields if mapping.pop(str(field).encode(), None) is not None)
+
+    async def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    async def sadd(self, key, *values):
+        members = self.data.setdefault(key, set())
+        added = {str(value).encode() for value in values} - members
+        members.update(added)
+        return len(added)
+
+    async def srem(self, key, *values):
+        members = self.data.get(key, set())
+        removed = {str(value).encode() for value in values} & members
+        members.difference_update(removed)
+        return len(removed)
+
+    async def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+        return 0
+
+    async def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.queued = []
+
+    def __getattr__(self, name):
+        command = getattr(self.redis, name)
+
+        async def queue(*args, **kwargs):
+            self.queued.append((command, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        results = [await command(*args, **kwargs) for command, args, kwargs in self.queued]
+        self.queued = []
+        return results
+
+
+class FakeRedisPool:
+
+    def __init__(self):
+        self.redis = FakeRedis()
+
+
+@pytest.fixture
+def redis():
+    return FakeRedisPool()
@@ -0,0 +1,92 @@
+import asyncio
+
+import msgpack
+
+import cachemanager
+from cachemanager import LocalCache
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_localcache_get_put(monkeypatch):
+    monkeypatch.setattr(cachemanager, 'monotonic', Clock())
+    cache = LocalCache(maxsize=4, maxttl=60)
+    assert cache.get('a') is None
+    cache.put('a', b'one', 10)
+    assert cache.get('a') == b'one'
+    cache.invalidate('a')
+    assert cache.get('a') is None
+
+
+def test_localcache_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cachemanager, 'monotonic', clock)
+    cache = LocalCache(maxsize=4, maxttl=30)
+    cache.put('short', b'1', 5)
+    cache.put('capped', b'2', 300)
+    clock.now += 6
+    assert cache.get('short') is None
+    assert cache.get('capped') == b'2'
+    clock.now += 25
+    assert cache.get('capped') is None
+    cache.put('zero', b'3', 0)
+    assert 'zero' not in cache.entries
+
+
+def test_localcache_admission(monkeypatch):
+    monkeypatch.setattr(cachemanager, 'monotonic', Clock())
+    cache = LocalCache(maxsize=2, maxttl=60)
+    for key in ('hot', 'warm'):
+        cache.put(key, key.encode(), 10)
+        cache.get(key)
+        cache.get(key)
+    cache.put('cold', b'cold', 10)
+    assert cache.get('cold') is None
+    assert list(cache.entries) == ['hot', 'warm']
+    for num in range(3):
+        cache.get('cold')
+    cache.put('cold', b'cold', 10)
+    assert list(cache.entries) == ['warm', 'cold']
+
+
+def test_localcache_lru_order(monkeypatch):
+    monkeypatch.setattr(cachemanager, 'monotonic', Clock())
+    cache = LocalCache(maxsize=2, maxttl=60)
+    cache.put('a', b'a', 10)
+    cache.put('b', b'b', 10)
+    cache.get('a')
+    cache.get('c')
+    cache.get('c')
+    cache.put('c', b'c', 10)
+    assert list(cache.entries) == ['a', 'c']
+
+
+def test_getcache_local_hit(monkeypatch, redis):
+    monkeypatch.setattr(cachemanager, 'localcache', LocalCache())
+
+    async def run():
+        await cachemanager.putcache(redis, 'key', {'players': ['a']}, 60)
+        await redis.redis.delete('key')
+        return await cachemanager.getcache(redis, 'key'), await cachemanager.getcache(redis, 'other')
+
+    assert asyncio.run(run()) == ({'players': ['a']}, None)
+    assert redis.redis.published == [(cachemanager.INVALIDATE_CHANNEL, f'{cachemanager.INSTANCE_ID}:key')]
+
+
+def test_getcache_redis_hit_fills_local(monkeypatch, redis):
+    monkeypatch.setattr(cachemanager, 'localcache', LocalCache())
+
+    async def run():
+        await redis.redis.set('key', msgpack.packb({'kills': 3}), ex=120)
+        first = await cachemanager.getcache(redis, 'key')
+        await redis.redis.delete('key')
+        return first, await cachemanager.getcache(redis, 'key')
+
+    assert asyncio.run(run()) == ({'kills': 3}, {'kills': 3})
@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+import circuitbreaker
+from circuitbreaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, circuit, setup_breakers
+from datafetch import APIClient
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuitbreaker, 'monotonic', clock)
+    return clock
+
+
+def tripped(clock, **settings):
+    breaker = CircuitBreaker('test', **dict({'window': 60, 'minimum': 4, 'threshold': 0.5, 'cooldown': 30}, **settings))
+    for success in (True, False, True, False):
+        assert breaker.allow()
+        breaker.record(success)
+    assert breaker.state == OPEN
+    return breaker
+
+
+def test_opens_at_threshold(clock):
+    breaker = CircuitBreaker('test', window=60, minimum=4, threshold=0.5, cooldown=30)
+    for success in (True, True, False):
+        breaker.record(success)
+    assert breaker.state == CLOSED
+    breaker.record(False)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_old_results_leave_the_window(clock):
+    breaker = CircuitBreaker('test', window=60, minimum=4, threshold=0.5, cooldown=30)
+    breaker.record(False)
+    breaker.record(False)
+    clock.now += 61
+    for success in (True, True, False):
+        breaker.record(success)
+    assert breaker.state == CLOSED
+    assert breaker.failures == 1
+
+
+def test_half_open_probe_closes(clock):
+    breaker = tripped(clock)
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 2
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_half_open_probe_reopens(clock):
+    breaker = tripped(clock)
+    clock.now += 31
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_release_frees_the_probe(clock):
+    breaker = tripped(clock)
+    clock.now += 31
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+class Client(APIClient):
+
+    name = 'TestAPI'
+
+    def __init__(self, api, error):
+        self.api = api
+        self.error = error
+        super().__init__('http://upstream/', session=object(), retries=0)
+
+    async def _send(self, url, params, stats, bucket):
+        raise self.error
+
+
+def probing(clock, api):
+    setup_breakers(60, 4, 0.5, 30)
+    breaker = circuit(api)
+    for num in range(4):
+        breaker.record(False)
+    clock.now += 31
+    return breaker
+
+
+def test_get_decode_error_fails_the_probe(clock):
+    breaker = probing(clock, 'decode')
+    resp = asyncio.run(Client('decode', ValueError('bad json'))._get('path'))
+    assert resp == [{'error': 'decode'}]
+    assert breaker.state == OPEN
+
+
+def test_get_unexpected_error_fails_the_probe(clock):
+    breaker = probing(clock, 'unexpected')
+    with pytest.raises(RuntimeError):
+        asyncio.run(Client('unexpected', RuntimeError('boom'))._get('path'))
+    assert breaker.state == OPEN
+    assert not breaker.probing
+
+
+def test_get_cancelled_releases_the_probe(clock):
+    breaker = probing(clock, 'cancelled')
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(Client('cancelled', asyncio.CancelledError())._get('path'))
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_get_fails_fast_when_open(clock):
+    setup_breakers(60, 4, 0.5, 30)
+    breaker = circuit('open')
+    for num in range(4):
+        breaker.record(False)
+    resp = asyncio.run(Client('open', RuntimeError('not called'))._get('path'))
+    assert resp == [{'error': circuitbreaker.UNAVAILABLE}]
@@ -0,0 +1,122 @@
+import asyncio
+import json
+
+import pytest
+
+from itemcatalog import ItemCatalog, catalog_flusher, normalize, trigrams
+
+ITEMS = {13937: 'Staff of Dominance', 16922: 'Lionheart Helm', 17063: 'Band of Accuria', 19137: 'Onslaught Girdle', 19406: "Drake Fang Talisman"}
+
+
+@pytest.fixture
+def filename(tmp_path):
+    return str(tmp_path / 'items.catalog')
+
+
+def filled(filename):
+    catalog = ItemCatalog(filename)
+    for itemid, name in ITEMS.items():
+        assert catalog.add(itemid, name)
+    return catalog
+
+
+def test_normalize():
+    assert normalize("  Drake   Fang Talisman ") == 'drake fang talisman'
+    assert normalize("Ashjre'thul, Crossbow of Smiting") == 'ashjrethul crossbow of smiting'
+    assert normalize('Thunderfury, Blessed Blade of the Windseeker') == 'thunderfury blessed blade of the windseeker'
+    assert normalize('Žanžibar') == 'zanzibar'
+    assert trigrams('ab') == {'  a', ' ab', 'ab '}
+
+
+def test_empty_catalog(filename):
+    catalog = ItemCatalog(filename)
+    assert len(catalog) == 0
+    assert catalog.lookup('staff of dominance') is None
+    assert catalog.save() is None
+
+
+def test_lookup_before_save(filename):
+    catalog = filled(filename)
+    assert catalog.lookup('STAFF OF DOMINANCE') == 13937
+    assert catalog.lookup('staff of dominanc') == 13937
+    assert not catalog.add(99999, 'Staff of Dominance')
+
+
+def test_save_and_open(filename):
+    filled(filename).save()
+    catalog = ItemCatalog(filename)
+    assert len(catalog) == len(ITEMS)
+    assert catalog.added == {}
+    assert dict(catalog.entries()) == {normalize(name): itemid for itemid, name in ITEMS.items()}
+    for itemid, name in ITEMS.items():
+        assert catalog.lookup(name) == itemid
+    catalog.close()
+
+
+def test_fuzzy_lookup(filename):
+    filled(filename).save()
+    catalog = ItemCatalog(filename)
+    assert catalog.lookup('drake fang talisma') == 19406
+    assert catalog.lookup('band of acuria') == 17063
+    assert catalog.lookup('lionhart helm') == 16922
+    assert catalog.lookup('staf of dominanse') == 13937
+    assert catalog.lookup('onslaught girdel') == 19137
+    assert catalog.lookup('drake fang talsman') == 19406
+    assert catalog.lookup('lionheart') is None
+    assert catalog.lookup('band of') is None
+    assert catalog.lookup('completely unrelated') is None
+    assert catalog.lookup('!!!') is None
+
+
+def test_added_items_merge_on_save(filename):
+    filled(filename).save()
+    catalog = ItemCatalog(filename)
+    catalog.add(18814, 'Choker of the Fire Lord')
+    assert catalog.lookup('choker of the fire lord') == 18814
+    other = ItemCatalog(filename)
+    other.add(17076, 'Bonereaver\'s Edge')
+    other.save()
+    catalog.save()
+    reopened = ItemCatalog(filename)
+    assert len(reopened) == len(ITEMS) + 2
+    assert reopened.lookup('bonereavers edge') == 17076
+    assert reopened.lookup('choker of the fire lord') == 18814
+
+
+def test_fuzzy_lookup_before_save(filename):
+    catalog = filled(filename)
+    assert catalog.lookup('lionhart helm') == 16922
+    assert catalog.lookup('staf of dominanse') == 13937
+
+
+def test_catalog_flusher(filename):
+    catalog = filled(filename)
+
+    async def run():
+        flusher = asyncio.ensure_future(catalog_flusher(catalog, interval=0.01))
+        for num in range(100):
+            await asyncio.sleep(0.01)
+            if len(catalog.added) == 0:
+                break
+        flusher.cancel()
+
+    asyncio.run(run())
+    assert catalog.added == {} and catalog.addedgrams == {}
+    assert catalog.lookup('lionhart helm') == 16922
+    assert len(ItemCatalog(filename)) == len(ITEMS)
+
+
+def test_seed(filename, tmp_path):
+    seedfile = tmp_path / 'items.json'
+    seedfile.write_text(json.dumps([{'itemId': itemid, 'name': name} for itemid, name in ITEMS.items()] + [{'name': 'No Id'}]))
+    catalog = ItemCatalog(filename)
+    assert catalog.seed(str(seedfile)) == len(ITEMS)
+    assert catalog.seed(str(seedfile)) == 0
+
+
+def test_unknown_format(filename):
+    with open(filename, 'wb') as catalogfile:
+        catalogfile.write(b'NOPE' + bytes(64))
+    catalog = ItemCatalog(filename)
+    assert len(catalog) == 0
+    assert catalog.lookup('staff of dominance') is None
@@ -0,0 +1,79 @@
+import asyncio
+from types import SimpleNamespace
+
+from classes import MemberIndex, SharedMemberIndex
+
+ADMIN_ROLE = 11
+USER_ROLE = 12
+
+
+def role(role_id, name):
+    return SimpleNamespace(id=role_id, name=name)
+
+
+def guild(guild_id, name, members):
+    fake = SimpleNamespace(id=guild_id, name=name, roles=[role(ADMIN_ROLE, 'Officer'), role(USER_ROLE, 'Raider')], text_channels=[SimpleNamespace(id=21, name='general')])
+    fake.members = [SimpleNamespace(id=member_id, guild=fake, roles=[role(role_id, 'role') for role_id in role_ids]) for member_id, role_ids in members.items()]
+    fake.member_count = len(fake.members)
+    return fake
+
+
+def test_local_index():
+    async def run():
+        index = MemberIndex()
+        first = guild(1, 'Guild', {100: [ADMIN_ROLE], 101: [USER_ROLE]})
+        await index.add_guild(first)
+        await index.remove(first.members[1])
+        return await index.memberships(100), await index.memberships(101)
+
+    assert asyncio.run(run()) == ({1: ('Guild', [ADMIN_ROLE])}, {})
+
+
+def test_shared_index_across_processes(redis):
+    async def run():
+        await SharedMemberIndex(redis).add_guild(guild(1, 'Guild', {100: [ADMIN_ROLE], 101: [USER_ROLE]}))
+        other = SharedMemberIndex(redis)
+        return await other.memberships(100), await other.memberships(101), (await other.guild(1))['channels']
+
+    assert asyncio.run(run()) == ({1: ('Guild', [ADMIN_ROLE])}, {1: ('Guild', [USER_ROLE])}, [[21, 'general']])
+
+
+def test_departed_members_lose_dm_permissions(redis):
+    async def run():
+        index = SharedMemberIndex(redis)
+        await index.add_guild(guild(1, 'Guild', {100: [ADMIN_ROLE], 101: [ADMIN_ROLE], 102: [USER_ROLE]}))
+        await index.add_guild(guild(2, 'Other', {100: [USER_ROLE]}))
+        restarted = SharedMemberIndex(redis)
+        await restarted.clear()
+        await restarted.add_guild(guild(1, 'Guild', {101: [USER_ROLE], 102: [USER_ROLE]}))
+        reader = SharedMemberIndex(redis)
+        return await reader.memberships(100), await reader.memberships(101), await redis.redis.smembers('guildmembers-1')
+
+    kicked, demoted, members = asyncio.run(run())
+    assert kicked == {2: ('Other', [USER_ROLE])}
+    assert demoted == {1: ('Guild', [USER_ROLE])}
+    assert members == {b'101', b'102'}
+
+
+def test_member_events_and_guild_removal(redis):
+    async def run():
+        index = SharedMemberIndex(redis)
+        first = guild(1, 'Guild', {100: [ADMIN_ROLE], 101: [USER_ROLE]})
+        await index.add_guild(first)
+        await index.remove(first.members[0])
+        removed = await SharedMemberIndex(redis).memberships(100)
+        await index.remove_guild(first)
+        reader = SharedMemberIndex(redis)
+        return removed, await reader.memberships(101), await reader.guild(1), await redis.redis.smembers('guildmembers-1')
+
+    assert asyncio.run(run()) == ({}, {}, None, set())
+
+
+def test_guild_rename(redis):
+    async def run():
+        index = SharedMemberIndex(redis)
+        await index.add_guild(guild(1, 'Guild', {100: [ADMIN_ROLE]}))
+        await index.update_guild(guild(1, 'Renamed', {}))
+        return await SharedMemberIndex(redis).memberships(100)
+
+    assert asyncio.run(run()) == {1: ('Renamed', [ADMIN_ROLE])}
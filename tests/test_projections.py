@@ -0,0 +1,91 @@
+import asyncio
+import json
+from pathlib import Path
+
+import msgpack
+
+import projections
+from cachemanager import _pack, _unpack
+from circuitbreaker import UNAVAILABLE
+from projections import cachekey, fights, fightsummary, projected, tables
+
+FIXTURES = Path(__file__).parent.parent / 'benchmarks' / 'fixtures'
+
+
+def fixture(name):
+    with (FIXTURES / f'{name}.json').open('r') as fixturefile:
+        return json.load(fixturefile)
+
+
+def roundtrip(value):
+    return _unpack(_pack(value, 60))[0]
+
+
+def test_cache_keys_are_versioned():
+    assert cachekey('tables', 'abc') == f'tables-v{projections.SCHEMAS["tables"][0]}-abc'
+    assert cachekey('fights', 'abc') == f'fights-v{projections.SCHEMAS["fights"][0]}-abc'
+
+
+def test_tables_projection():
+    resp = {'totalTime': 1, 'entries': [{'name': 'Alice', 'spec': 'Holy', 'icon': 'Priest-Holy', 'class': 'Priest', 'itemLevel': 60, 'total': 99,
+                                         'gear': [{'id': 1, 'name': 'Helm', 'slot': 0, 'itemLevel': 66, 'quality': 'epic'}]},
+                                        {'name': 'Alice', 'spec': 'Shadow'}, {'id': 5}]}
+    assert tables(resp) == {'players': {'Alice': {'spec': 'Holy', 'icon': 'Priest-Holy', 'class': 'Priest', 'itemLevel': 60,
+                                                  'gear': [{'id': 1, 'name': 'Helm', 'slot': 0, 'itemLevel': 66}]}}}
+
+
+def test_tables_roundtrip():
+    resp = fixture('tables')
+    projected = tables(resp)
+    assert roundtrip(projected) == projected
+    assert len(msgpack.packb(projected)) < len(msgpack.packb(resp))
+    first = resp['entries'][0]
+    player = projected['players'][first['name']]
+    assert player['icon'] == first['icon'] and player['itemLevel'] == first['itemLevel']
+    assert [item['id'] for item in player['gear']] == [item['id'] for item in first['gear']]
+
+
+def test_fights_roundtrip():
+    projected = fights(fixture('fights'))
+    assert roundtrip(projected) == projected
+    assert projected['kills'] > 0 and projected['lastboss'] is not None
+
+
+def test_fights_summary():
+    resp = {'fights': [{'name': 'Trash'}, {'name': 'Onyxia', 'kill': True, 'size': 40}, {'name': 'Magmadar', 'kill': False, 'size': 40},
+                       {'name': 'Ragnaros', 'kill': True, 'size': 39}]}
+    assert roundtrip(fights(resp)) == {'kills': 2, 'wipes': 1, 'size': 39, 'lastboss': 'Ragnaros'}
+
+
+def test_fights_without_a_kill():
+    summary = roundtrip(fights({'fights': [{'name': 'Trash'}, {'name': 'Magmadar', 'kill': False, 'size': 40}]}))
+    assert summary == {'kills': 0, 'wipes': 1, 'size': 0, 'lastboss': None}
+    assert roundtrip(fights({})) == {'kills': 0, 'wipes': 0, 'size': 0, 'lastboss': None}
+
+
+def test_fightsummary():
+    assert fightsummary(fights({'fights': [{'name': 'Onyxia', 'kill': True, 'size': 40}]})) == (1, 0, 40, 'Onyxia')
+
+
+def test_fightsummary_wipes_only():
+    fight = roundtrip(fights({'fights': [{'name': 'Trash'}, {'name': 'Magmadar', 'kill': False, 'size': 40}, {'name': 'Magmadar', 'kill': False, 'size': 40}]}))
+    assert fightsummary(fight) == (0, 2, 0, None)
+
+
+def test_fightsummary_error_payloads():
+    assert fightsummary(roundtrip([{'error': 404}])) is None
+    assert fightsummary([{'error': UNAVAILABLE}]) is None
+    assert fightsummary(None) is None
+
+
+def test_errors_pass_through():
+    error = [{'error': 404}]
+    assert tables(error) is error
+    assert fights(error) is error
+
+
+def test_projected_fetcher():
+    async def fetcher():
+        return {'fights': [{'name': 'Onyxia', 'kill': True, 'size': 40}]}
+
+    assert asyncio.run(projected('fights', fetcher)()) == {'kills': 1, 'wipes': 0, 'size': 40, 'lastboss': 'Onyxia'}
@@ -0,0 +1,82 @@
+import asyncio
+
+import ratelimit
+from ratelimit import BACKGROUND, INTERACTIVE, RateLimiter, TokenBucket, retry_after
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_burst_and_refill(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, 'monotonic', clock)
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.try_acquire() for num in range(4)] == [True, True, True, False]
+    clock.now += 0.5
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    clock.now += 60
+    assert [bucket.try_acquire() for num in range(4)] == [True, True, True, False]
+
+
+def test_bucket_block(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, 'monotonic', clock)
+    bucket = TokenBucket(rate=10, burst=10)
+    assert bucket.observe(429, {'Retry-After': '5'}) == 5
+    clock.now += 4
+    assert not bucket.try_acquire()
+    clock.now += 2
+    assert bucket.try_acquire()
+
+
+def test_waiters_served_by_priority():
+    async def run():
+        bucket = TokenBucket(rate=50, burst=1)
+        assert bucket.try_acquire()
+        order = []
+
+        async def waiter(name, level):
+            await bucket.acquire(level)
+            order.append(name)
+
+        tasks = [asyncio.ensure_future(waiter('background1', BACKGROUND)), asyncio.ensure_future(waiter('interactive1', INTERACTIVE)),
+                 asyncio.ensure_future(waiter('background2', BACKGROUND)), asyncio.ensure_future(waiter('interactive2', INTERACTIVE))]
+        await asyncio.wait_for(asyncio.gather(*tasks), 2)
+        return order
+
+    assert asyncio.run(run()) == ['interactive1', 'interactive2', 'background1', 'background2']
+
+
+def test_cancelled_waiter_is_skipped():
+    async def run():
+        bucket = TokenBucket(rate=50, burst=1)
+        assert bucket.try_acquire()
+        first = asyncio.ensure_future(bucket.acquire())
+        second = asyncio.ensure_future(bucket.acquire())
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.wait_for(second, 2)
+        return first.cancelled(), len(bucket.waiters)
+
+    assert asyncio.run(run()) == (True, 0)
+
+
+def test_retry_after():
+    assert retry_after({'Retry-After': '3'}) == 3
+    assert retry_after({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '7'}) == 7
+    assert retry_after({'X-RateLimit-Remaining': '5', 'X-RateLimit-Reset': '7'}) is None
+    assert retry_after({}) is None
+
+
+def test_limiter_buckets():
+    limiter = RateLimiter({'blizzard': (100, 100)})
+    assert limiter.bucket('nexus') is None
+    assert limiter.bucket('blizzard', 'a') is limiter.bucket('blizzard', 'a')
+    assert limiter.bucket('blizzard', 'a') is not limiter.bucket('blizzard', 'b')
@@ -0,0 +1,118 @@
+import json
+from collections import deque
+from contextvars import ContextVar
+from random import random
+from sys import argv, stdout
+from time import perf_counter, time
+from uuid import uuid4
+
+from loguru import logger as log
+
+current = ContextVar('span', default=None)
+settings = {'rate': 0.0, 'slow': 0.0}
+recent = deque(maxlen=100)
+tracelog = log.bind(trace=True)
+
+
+class NoopSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NOOP = NoopSpan()
+
+
+class Trace:
+
+    def __init__(self):
+        self.id = uuid4().hex[:16]
+        self.started = time()
+        self.origin = perf_counter()
+        self.spans = []
+        self.count = 0
+
+    def record(self, root):
+        spans = [{'id': span.id, 'parent': span.parent.id if span.parent is not None else None, 'name': span.name, 'offset': round(span.start - self.origin, 6), 'duration': round(span.duration, 6), 'attrs': span.attrs} for span in self.spans]
+        return {'trace': self.id, 'name': root.name, 'start': self.started, 'duration': round(root.duration, 6), 'spans': spans}
+
+
+class Span:
+
+    __slots__ = ('trace', 'id', 'name', 'parent', 'attrs', 'start', 'duration', 'token')
+
+    def __init__(self, trace, name, parent, attrs):
+        trace.count = trace.count + 1
+        self.trace = trace
+        self.id = trace.count
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.duration = 0.0
+
+    def __enter__(self):
+        self.start = perf_counter()
+        self.token = current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        current.reset(self.token)
+        self.trace.spans.append(self)
+        if self.parent is None:
+            _finish(self.trace, self)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+def setup_tracing(rate, slow):
+    settings.update(rate=rate, slow=slow)
+
+
+def trace(name, **attrs):
+    if settings['rate'] <= 0 and settings['slow'] <= 0:
+        return NOOP
+    return Span(Trace(), name, None, attrs)
+
+
+def span(name, **attrs):
+    parent = current.get()
+    if parent is None:
+        return NOOP
+    return Span(parent.trace, name, parent, attrs)
+
+
+def _finish(trace, root):
+    if random() < settings['rate'] or (settings['slow'] > 0 and root.duration >= settings['slow']):
+        record = trace.record(root)
+        recent.append(record)
+        tracelog.info(json.dumps(record, default=str))
+
+
+def chrome_trace(records):
+    events = []
+    for tid, record in enumerate(records, 1):
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': f"{record['name']} {record['trace']}"}})
+        for spanrecord in record['spans']:
+            events.append({'name': spanrecord['name'], 'cat': record['name'], 'ph': 'X', 'pid': 1, 'tid': tid, 'ts': int((record['start'] + spanrecord['offset']) * 1000000), 'dur': int(spanrecord['duration'] * 1000000), 'args': spanrecord['attrs']})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+if __name__ == '__main__':
+    records = []
+    for filename in argv[1:]:
+        with open(filename, 'r') as tracefile:
+            for line in tracefile:
+                if line.strip() != '':
+                    records.append(json.loads(line))
+    json.dump(chrome_trace(records), stdout)
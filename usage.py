@@ -0,0 +1,78 @@
+from asyncio import sleep
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+from hashlib import sha1
+from time import time
+
+from loguru import logger as log
+
+BUCKET = 3600
+RETENTION = 8 * 86400
+UPSTREAM = 'upstream'
+SAVED = 'saved'
+
+attribution = ContextVar('attribution', default=None)
+pending = Counter()
+
+
+def attribute(guild_id, command):
+    attribution.set((str(guild_id), command))
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(key):
+    if key is None:
+        return '-'
+    return sha1(str(key).encode()).hexdigest()[:8]
+
+
+def record(kind, api, key=None):
+    guild, command = attribution.get() or ('-', '-')
+    pending[(int(time() // BUCKET) * BUCKET, kind, api, fingerprint(key), guild, command)] += 1
+
+
+async def flush(redis):
+    if len(pending) == 0:
+        return None
+    counts = dict(pending)
+    pending.clear()
+    try:
+        pipe = await redis.redis.pipeline(transaction=False)
+        buckets = set()
+        for (bucket, kind, api, keyprint, guild, command), count in counts.items():
+            await pipe.hincrby(f'usage-{bucket}', f'{kind}|{api}|{keyprint}|{guild}|{command}', count)
+            buckets.add(bucket)
+        for bucket in buckets:
+            await pipe.expire(f'usage-{bucket}', RETENTION)
+        await pipe.execute()
+    except:
+        log.exception('Error flushing usage counters, retrying next interval')
+        pending.update(counts)
+
+
+async def usage_flusher(redis, interval=60):
+    while True:
+        await sleep(interval)
+        await flush(redis)
+
+
+async def report(redis, hours):
+    current = int(time() // BUCKET) * BUCKET
+    pipe = await redis.redis.pipeline(transaction=False)
+    for num in range(hours):
+        await pipe.hgetall(f'usage-{current - num * BUCKET}')
+    totals = {'guild': Counter(), 'command': Counter(), 'key': Counter(), 'saved': Counter(), 'upstream': 0, 'hits': 0}
+    for bucket in await pipe.execute():
+        for field, count in bucket.items():
+            kind, api, keyprint, guild, command = field.decode().split('|')
+            count = int(count)
+            if kind == UPSTREAM:
+                totals['upstream'] += count
+                totals['guild'][guild] += count
+                totals['command'][command] += count
+                totals['key'][f'{api}:{keyprint}'] += count
+            else:
+                totals['hits'] += count
+                totals['saved'][api] += count
+    return totals